@@ -0,0 +1,172 @@
+# End-to-end browsing and import benchmark, runs inside Blender:
+#
+#     blender --background --factory-startup --python benchmarks/bench_browse.py -- [--latency 0.05] [--json results.json]
+#
+# Starts mock_server.py in a thread, points the add-on's server
+# preference at it and drives the add-on the way the panel does, with
+# an empty cache (cold) and again with the cache filled (warm):
+#
+#   browse           Update: categories, first category, first detail
+#   category_switch  select every category in turn
+#   scroll           select every material of a category in turn
+#   import           download and import materials through bmd.import
+#
+# Times are wall-clock seconds; the server's per-endpoint request and
+# byte counts are reported next to them.
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import bpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_startup import MODULE_NAME, enable_addon
+from mock_server import MockServer
+
+
+STORAGE_NAME = 'bmd_bench_material'
+
+
+def make_library(filepath):
+    mat = bpy.data.materials.new(STORAGE_NAME)
+    mat.use_nodes = True
+    bpy.data.libraries.write(filepath, {mat})
+    bpy.data.materials.remove(mat)
+
+
+def configure(cache_path, server, requests_per_second):
+    prefs = bpy.context.preferences.addons[MODULE_NAME].preferences
+    prefs.cache_path = cache_path
+    prefs.base_url = server.url
+    prefs.requests_per_second = requests_per_second
+
+
+def clear_cache(addon, cache_path):
+    shutil.rmtree(cache_path, ignore_errors=True)
+    addon.reset_cache_path()
+    addon.get_cache_path()
+    addon._loaded_data.clear()
+    addon.cache_index = addon.CacheIndex()
+    with addon._engine_index_lock:
+        addon._engine_index.clear()
+    addon.catalogue = addon.Catalogue()
+    addon._image_tiers.clear()
+
+
+def clear_browser(wm):
+    wm.bmd_search = ''
+    wm.bmd_material_list.clear()
+    wm.bmd_category_list.clear()
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def browse(addon, context):
+    clear_browser(context.window_manager)
+    addon.update_categories(context)
+
+
+def switch_categories(context):
+    wm = context.window_manager
+    for i in range(len(wm.bmd_category_list)):
+        wm.bmd_category_list_idx = i
+
+
+def scroll(context, count):
+    wm = context.window_manager
+    for i in range(min(count, len(wm.bmd_material_list))):
+        wm.bmd_material_list_idx = i
+
+
+def import_materials(context, count):
+    wm = context.window_manager
+    for i in range(min(count, len(wm.bmd_material_list))):
+        wm.bmd_material_list_idx = i
+        getattr(bpy.ops.bmd, 'import')()
+
+
+def remove_imported():
+    for mat in [mat for mat in bpy.data.materials if 'bmd_id' in mat]:
+        bpy.data.materials.remove(mat)
+    for library in list(bpy.data.libraries):
+        bpy.data.libraries.remove(library)
+
+
+def run_cases(addon, context, server, args):
+    cases = (
+        ('browse', lambda: browse(addon, context)),
+        ('category_switch', lambda: switch_categories(context)),
+        ('scroll', lambda: scroll(context, args.scroll)),
+        ('import', lambda: import_materials(context, args.imports)),
+    )
+    results = {}
+    for name, func in cases:
+        server.reset_stats()
+        results[name] = {'seconds': timed(func), 'server': server.stats()}
+    return results
+
+
+def main():
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    parser = argparse.ArgumentParser(description='Benchmark browsing and importing against a mock server.')
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--bandwidth', type=int, default=0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--categories', type=int, default=10)
+    parser.add_argument('--materials', type=int, default=100)
+    parser.add_argument('--scroll', type=int, default=30, help='materials selected in the scroll case')
+    parser.add_argument('--imports', type=int, default=5, help='materials imported in the import case')
+    parser.add_argument('--requests-per-second', type=float, default=8.0)
+    parser.add_argument('--paging', action='store_true', help='serve material lists in pages')
+    parser.add_argument('--image-tiers', action='store_true', help='let the server scale thumbnails')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args(argv)
+
+    addon = enable_addon()
+    context = bpy.context
+    if bpy.app.background:
+        # no GL here, fetch the thumbnail like the panel would but skip the upload
+        addon.get_preview().load_image = lambda url: addon.get_image(url, size=addon.THUMBNAIL_SIZE)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        library = os.path.join(tmp, 'library.blend')
+        make_library(library)
+        cache_path = os.path.join(tmp, 'cache')
+        server = MockServer(
+            latency=args.latency, bandwidth=args.bandwidth, failure_rate=args.failure_rate,
+            categories=args.categories, materials=args.materials, paging=args.paging,
+            image_tiers=args.image_tiers,
+            library=library, storage_name=STORAGE_NAME,
+        )
+        with server:
+            configure(cache_path, server, args.requests_per_second)
+            clear_cache(addon, addon.get_cache_path())
+            results['cold'] = run_cases(addon, context, server, args)
+            remove_imported()
+            results['warm'] = run_cases(addon, context, server, args)
+            remove_imported()
+    addon.unregister()
+    del sys.modules[MODULE_NAME]
+
+    for state in ('cold', 'warm'):
+        for name, result in results[state].items():
+            requests = sum(entry['requests'] for entry in result['server'].values())
+            print('{:<5} {:<16} {:>9.1f} ms {:>5} requests'.format(state, name, result['seconds'] * 1000, requests))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'settings': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# Micro-benchmark for the on-disk format of cached catalogue data.
+#
+# Compares the old pickle cache with the raw JSON body (plain and zlib
+# compressed) the add-on stores now. Plain Python, no Blender needed:
+#
+#     python benchmarks/bench_cache_format.py [--materials N] [--repeat N]
+
+import argparse
+import json
+import marshal
+import os
+import pickle
+import tempfile
+import time
+import zlib
+
+
+def make_category(size, category):
+    return [
+        {
+            'id': category * 100000 + i,
+            'slug': 'material-{}-{}'.format(category, i),
+            'name': 'Material {} {}'.format(category, i),
+        }
+        for i in range(size)
+    ]
+
+
+def encode_pickle(data):
+    return pickle.dumps(data)
+
+def decode_pickle(raw):
+    return pickle.loads(raw)
+
+def encode_json(data):
+    return json.dumps(data).encode('UTF-8')
+
+def decode_json(raw):
+    return json.loads(str(raw, 'UTF-8'))
+
+def encode_json_zlib(data):
+    return zlib.compress(encode_json(data), 1)
+
+def decode_json_zlib(raw):
+    return decode_json(zlib.decompress(raw))
+
+def encode_marshal(data):
+    return marshal.dumps(data)
+
+def decode_marshal(raw):
+    return marshal.loads(raw)
+
+
+FORMATS = (
+    ('pickle', encode_pickle, decode_pickle),
+    ('marshal', encode_marshal, decode_marshal),
+    ('json', encode_json, decode_json),
+    ('json+zlib', encode_json_zlib, decode_json_zlib),
+)
+
+
+def bench(data, repeat):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, encode, decode in FORMATS:
+            filepath = os.path.join(tmp, name)
+            with open(filepath, 'wb') as f:
+                f.write(encode(data))
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                with open(filepath, 'rb') as f:
+                    decode(f.read())
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results.append((name, os.path.getsize(filepath), best))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare cache formats for category lists.')
+    parser.add_argument('--materials', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print('{:>9}  {:<10} {:>10} {:>10}'.format('materials', 'format', 'bytes', 'load ms'))
+    for size in args.materials:
+        for name, nbytes, seconds in bench(make_category(size, 1), args.repeat):
+            print('{:>9}  {:<10} {:>10} {:>10.3f}'.format(size, name, nbytes, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+# Cache lookup benchmark, runs inside Blender:
+#
+#     blender --background --factory-startup --python benchmarks/bench_freshness.py -- [--addon FILE] [--json results.json]
+#
+# Fills the cache from mock_server.py, then repeats warm lookups of every
+# resource type and counts the file system calls each one makes (stat,
+# open, mkdir, scandir and friends) next to its time. To compare with
+# another version of the add-on, pass it with --addon, e.g.
+#
+#     git show HEAD~1:blendermada-2.0.py > /tmp/before.py
+
+import argparse
+import builtins
+import json
+import os
+import sys
+import tempfile
+import time
+
+import bpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_startup import ADDON_PATH, MODULE_NAME, enable_addon
+from mock_server import MockServer
+
+
+COUNTED = (
+    (os, 'stat'),
+    (os, 'lstat'),
+    (os, 'mkdir'),
+    (os, 'scandir'),
+    (os, 'listdir'),
+    (os, 'remove'),
+    (os, 'replace'),
+    (builtins, 'open'),
+)
+
+
+class SyscallCounter(object):
+    # wraps the os functions the add-on reaches the file system through
+
+    def __init__(self):
+        self.counts = {}
+        self.originals = []
+
+    def __enter__(self):
+        for module, name in COUNTED:
+            original = getattr(module, name)
+            self.originals.append((module, name, original))
+            setattr(module, name, self.wrap(name, original))
+        return self
+
+    def __exit__(self, *exc):
+        for module, name, original in self.originals:
+            setattr(module, name, original)
+        self.originals = []
+
+    def wrap(self, name, original):
+        def counted(*args, **kwargs):
+            self.counts[name] = self.counts.get(name, 0) + 1
+            return original(*args, **kwargs)
+        return counted
+
+
+def configure(cache_path, server):
+    prefs = bpy.context.preferences.addons[MODULE_NAME].preferences
+    prefs.cache_path = cache_path
+    if hasattr(prefs, 'base_url'):
+        prefs.base_url = server.url
+    else: # older versions only know blendermada.com, reach the mock as a proxy
+        prefs.proxy_use_proxy = True
+        prefs.proxy_server = '127.0.0.1'
+        prefs.proxy_port = str(server.port)
+
+
+def main():
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    parser = argparse.ArgumentParser(description='Count file system calls of warm cache lookups.')
+    parser.add_argument('--addon', default=ADDON_PATH, help='add-on file to measure')
+    parser.add_argument('--repeat', type=int, default=1000)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args(argv)
+
+    addon = enable_addon(args.addon)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, MockServer(categories=2, materials=10) as server:
+        configure(tmp, server)
+        detail = addon.get_material_detail(1)
+        lookups = (
+            ('cache_path', lambda: addon.get_cache_path()),
+            ('categories', lambda: addon.get_categories()),
+            ('materials', lambda: addon.get_materials(1)),
+            ('details', lambda: addon.get_material_detail(1)),
+            ('images', lambda: addon.get_image(detail['image'])),
+            ('libraries', lambda: addon.fetch_file(addon.get_library_path(detail['storage']), detail['storage'])),
+        )
+        for name, func in lookups:
+            func() # cold: downloads
+            server.reset_stats()
+            with SyscallCounter() as counter:
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    func()
+                seconds = time.perf_counter() - start
+            results[name] = {
+                'us_per_lookup': seconds / args.repeat * 1e6,
+                'syscalls_per_lookup': dict((k, v / float(args.repeat)) for k, v in counter.counts.items()),
+                'requests': sum(entry['requests'] for entry in server.stats().values()),
+            }
+    addon.unregister()
+    del sys.modules[MODULE_NAME]
+
+    for name, result in results.items():
+        calls = result['syscalls_per_lookup']
+        print('{:<11} {:>8.1f} us {:>5.1f} fs calls  {}'.format(
+            name,
+            result['us_per_lookup'],
+            sum(calls.values()),
+            ', '.join('%s %g' % item for item in sorted(calls.items())) or '-',
+        ))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'addon': args.addon, 'repeat': args.repeat, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
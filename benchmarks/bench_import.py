@@ -0,0 +1,85 @@
+# Import benchmark, runs inside Blender:
+#
+#     blender --background --factory-startup --python benchmarks/bench_import.py -- [--materials N]
+#
+# Builds a library with N materials and compares importing them one by
+# one through bpy.ops.wm.append (the old import path) with the add-on's
+# load_materials() in append and link mode.
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import bpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_startup import load_addon
+
+
+def make_library(filepath, count):
+    mats = set()
+    for i in range(count):
+        mat = bpy.data.materials.new('bench_material_%d' % (i,))
+        mat.use_nodes = True
+        mats.add(mat)
+    bpy.data.libraries.write(filepath, mats)
+    names = [mat.name for mat in mats]
+    for mat in mats:
+        bpy.data.materials.remove(mat)
+    return sorted(names)
+
+
+def clear_materials(names):
+    for name in names:
+        if name in bpy.data.materials:
+            bpy.data.materials.remove(bpy.data.materials[name])
+    for library in list(bpy.data.libraries):
+        bpy.data.libraries.remove(library)
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def bench_ops_append(filepath, names):
+    directory = os.path.join(filepath, 'Material', '')
+    for name in names:
+        bpy.ops.wm.append(filepath=directory + name, directory=directory, filename=name)
+
+
+def main():
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    parser = argparse.ArgumentParser(description='Compare material import paths.')
+    parser.add_argument('--materials', type=int, default=50)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args(argv)
+
+    addon = load_addon()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        filepath = os.path.join(tmp, 'library.blend')
+        names = make_library(filepath, args.materials)
+        cases = (
+            ('wm.append', lambda: bench_ops_append(filepath, names)),
+            ('load_materials', lambda: addon.load_materials(filepath, names)),
+            ('load_materials_link', lambda: addon.load_materials(filepath, names, link=True)),
+        )
+        for name, func in cases:
+            results[name] = timed(func)
+            clear_materials(names)
+
+    for name, seconds in results.items():
+        print('{:<20} {:>8.1f} ms'.format(name, seconds * 1000))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'materials': args.materials, 'seconds': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# Startup benchmark, runs inside Blender:
+#
+#     blender --background --factory-startup --python benchmarks/bench_startup.py -- [--repeat N]
+#
+# Reports how long importing the add-on module and calling register()
+# take, i.e. what the add-on adds to Blender launch, and which modules
+# it drags in that were not loaded before.
+
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import time
+
+
+ADDON_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'blendermada-2.0.py')
+MODULE_NAME = 'blendermada_client'
+
+
+# The benchmarks, the tests and the LAN server all load the add-on file
+# through these, under the name Blender would give it.
+
+def load_addon(path=ADDON_PATH):
+    spec = importlib.util.spec_from_file_location(MODULE_NAME, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[MODULE_NAME] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def enable_addon(path=ADDON_PATH):
+    # loaded, registered and enabled, so it has its preferences
+    import bpy
+    module = load_addon(path)
+    module.register()
+    if MODULE_NAME not in bpy.context.preferences.addons:
+        bpy.context.preferences.addons.new().module = MODULE_NAME
+    return module
+
+
+def load_and_register():
+    before = set(sys.modules)
+    start = time.perf_counter()
+    module = load_addon()
+    imported = time.perf_counter()
+    module.register()
+    registered = time.perf_counter()
+    new_modules = sorted(set(sys.modules) - before - {MODULE_NAME})
+    module.unregister()
+    del sys.modules[MODULE_NAME]
+    return imported - start, registered - imported, new_modules
+
+
+def main():
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    parser = argparse.ArgumentParser(description='Measure add-on import and register time.')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args(argv)
+
+    import_times, register_times = [], []
+    new_modules = None
+    for _ in range(args.repeat):
+        import_time, register_time, modules = load_and_register()
+        if new_modules is None:
+            new_modules = modules # only the first run imports anything new
+        import_times.append(import_time)
+        register_times.append(register_time)
+
+    results = {
+        'first_import_ms': import_times[0] * 1000,
+        'import_ms': statistics.median(import_times) * 1000,
+        'register_ms': statistics.median(register_times) * 1000,
+        'new_modules': new_modules,
+    }
+    print('first import   {:8.2f} ms'.format(results['first_import_ms']))
+    print('import (warm)  {:8.2f} ms'.format(results['import_ms']))
+    print('register       {:8.2f} ms'.format(results['register_ms']))
+    print('new modules    {}'.format(', '.join(new_modules) or '-'))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
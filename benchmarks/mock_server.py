@@ -0,0 +1,337 @@
+# Local stand-in for the Blendermada site, for benchmarks and for trying
+# the add-on without the network. Plain Python, no Blender needed:
+#
+#     python benchmarks/mock_server.py [--port 8000] [--latency 0.05] [--bandwidth 1000000] ...
+#
+# Serves the categories, materials, material and favorites API endpoints
+# plus thumbnails and material libraries, with configurable latency,
+# bandwidth, catalogue size and failure injection. Point the add-on's
+# server preference at it. Absolute request URIs are accepted as well,
+# so it also works as the add-on's proxy.
+
+import argparse
+import gzip
+import json
+import random
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+ENGINES = ('cyc', 'eve')
+WRITE_CHUNK_SIZE = 16 * 1024
+
+
+def make_png(size):
+    # a plain grey RGB square, enough for bpy.data.images.load()
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body))
+    row = b'\x00' + b'\x80' * (size * 3)
+    return b''.join((
+        b'\x89PNG\r\n\x1a\n',
+        chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0)),
+        chunk(b'IDAT', zlib.compress(row * size)),
+        chunk(b'IEND', b''),
+    ))
+
+
+def make_library(size):
+    # passes the add-on's header check, not importable
+    return b'BLENDER-v300' + b'\x00' * max(size - 12, 0)
+
+
+def paginate(items, path, query):
+    # one page of a list, in the shape the site sends; tools/lan_server.py
+    # pages its lists with this as well
+    from urllib.parse import urlencode
+    page, size = int(query['page']), int(query.get('page_size', 100))
+    if page < 1 or size < 1:
+        raise ValueError(page)
+    def link(number):
+        return '%s?%s' % (path, urlencode(dict(query, page=number)))
+    return {
+        'count': len(items),
+        'next': link(page + 1) if page * size < len(items) else None,
+        'previous': link(page - 1) if page > 1 else None,
+        'results': items[(page - 1) * size:page * size],
+    }
+
+
+class Catalogue(object):
+
+    def __init__(self, categories=10, materials=100, storage_name='Material', seed=0):
+        rnd = random.Random(seed)
+        self.categories = [
+            {'id': c, 'slug': 'category-%d' % (c,), 'name': 'Category %d' % (c,)}
+            for c in range(1, categories + 1)
+        ]
+        self.materials = {}
+        self.by_category = {}
+        for c in range(1, categories + 1):
+            ids = []
+            for i in range(materials):
+                id = (c - 1) * materials + i + 1
+                ids.append(id)
+                self.materials[id] = {
+                    'id': id,
+                    'slug': 'material-%d' % (id,),
+                    'name': 'Material %d' % (id,),
+                    'description': 'Benchmark material %d\nin category %d' % (id, c),
+                    'downloads': rnd.randint(0, 10000),
+                    'rating': round(rnd.uniform(0.0, 5.0), 2),
+                    'votes': rnd.randint(0, 500),
+                    'storage_name': storage_name,
+                }
+            self.by_category[c] = ids
+
+    def listing(self, ids, engine):
+        # Eevee gets two thirds of the materials so the engines differ
+        return [
+            dict((k, self.materials[id][k]) for k in ('id', 'slug', 'name'))
+            for id in ids if engine != 'eve' or id % 3
+        ]
+
+    def detail(self, id, base_url):
+        mat = dict(self.materials[id])
+        mat['image'] = '%smedia/images/mat-%d.png' % (base_url, id)
+        mat['storage'] = '%smedia/files/mat-%d.blend' % (base_url, id)
+        return mat
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        if self.server.mock.verbose:
+            BaseHTTPRequestHandler.log_message(self, *args)
+
+    def do_GET(self):
+        mock = self.server.mock
+        url = urlsplit(self.path)
+        if url.netloc: # proxy style absolute URI
+            base_url = '%s://%s/' % (url.scheme, url.netloc)
+        else:
+            base_url = 'http://%s/' % (self.headers.get('Host', '%s:%d' % self.server.server_address),)
+        query = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+        endpoint = url.path.rsplit('/', 1)[0] if url.path.startswith('/media/') else url.path
+        if mock.latency:
+            time.sleep(mock.latency)
+        if mock.should_fail():
+            mock.count(endpoint, 0, failed=True)
+            return self.send_body(503, b'{"error": "injected failure"}', 'application/json')
+        try:
+            status, body, content_type = mock.route(url.path, query, base_url)
+        except (KeyError, ValueError):
+            status, body, content_type = 404, b'{"error": "not found"}', 'application/json'
+        self.send_body(status, body, content_type, endpoint)
+
+    def send_body(self, status, body, content_type, endpoint=None):
+        mock = self.server.mock
+        encoding = None
+        if content_type == 'application/json' and mock.use_gzip \
+                and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body, encoding = gzip.compress(body), 'gzip'
+        truncate = mock.should_truncate() and len(body) > 1
+        payload = body[:len(body) // 2] if truncate else body
+        if endpoint is not None: # before the client can see the answer
+            mock.count(endpoint, len(payload), failed=truncate)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if mock.cache_control and status == 200:
+            self.send_header('Cache-Control', mock.cache_control)
+        if truncate:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        for start in range(0, len(payload), WRITE_CHUNK_SIZE):
+            chunk = payload[start:start + WRITE_CHUNK_SIZE]
+            self.wfile.write(chunk)
+            if mock.bandwidth:
+                time.sleep(len(chunk) / float(mock.bandwidth))
+
+
+class MockServer(object):
+    """Blendermada stand-in running in a background thread.
+
+    Use as a context manager or call start() and stop(). Latency is added
+    to every request in seconds, bandwidth caps the body rate in bytes
+    per second (0 means unlimited), failure_rate answers that share of
+    requests with 503 and truncate_rate cuts that share of bodies in half.
+    cache_control is sent as the Cache-Control header of good answers.
+    With paging, material lists are split into pages when page is asked
+    for, like a server with paged listings would. With image_tiers,
+    thumbnails asked for with a size are scaled down to it.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, bandwidth=0,
+                 failure_rate=0.0, truncate_rate=0.0, categories=10, materials=100,
+                 image_size=128, library=None, library_size=256 * 1024,
+                 storage_name='Material', use_gzip=True, cache_control=None, paging=False,
+                 image_tiers=False, seed=0, verbose=False):
+        self.address = (host, port)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.truncate_rate = truncate_rate
+        self.use_gzip = use_gzip
+        self.cache_control = cache_control
+        self.paging = paging
+        self.image_tiers = image_tiers
+        self.verbose = verbose
+        self.catalogue = Catalogue(categories, materials, storage_name, seed)
+        self.listings = {}
+        self.image_size = image_size
+        self.image = make_png(image_size)
+        self.tiers = {}
+        if library is not None:
+            with open(library, 'rb') as f:
+                self.library = f.read()
+        else:
+            self.library = make_library(library_size)
+        self.fail_next = 0 # answer that many requests with 503 before the rates apply
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.httpd = None
+        self.thread = None
+        self.reset_stats()
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    @property
+    def url(self):
+        return 'http://%s:%d/' % self.httpd.server_address[:2]
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer(self.address, Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def should_fail(self):
+        with self.lock:
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                return True
+            return self.failure_rate > 0 and self.random.random() < self.failure_rate
+
+    def should_truncate(self):
+        with self.lock:
+            return self.truncate_rate > 0 and self.random.random() < self.truncate_rate
+
+    def count(self, endpoint, size, failed=False):
+        with self.lock:
+            entry = self.counters.setdefault(endpoint, {'requests': 0, 'bytes': 0, 'failed': 0})
+            entry['requests'] += 1
+            entry['bytes'] += size
+            entry['failed'] += failed
+
+    def stats(self):
+        with self.lock:
+            return dict((k, dict(v)) for k, v in self.counters.items())
+
+    def reset_stats(self):
+        with self.lock:
+            self.counters = {}
+
+    def route(self, path, query, base_url):
+        cat = self.catalogue
+        if path == '/api/materials/categories.json':
+            return self.json(cat.categories)
+        if path == '/api/materials/materials.json':
+            mats = self.category_listing(int(query['category']), query.get('engine'))
+            if self.paging and 'page' in query:
+                return self.json(paginate(mats, path, query))
+            return self.json(mats)
+        if path == '/api/materials/material.json':
+            return self.json(cat.detail(int(query['id']), base_url))
+        if path == '/api/materials/v1/favorites.json':
+            if not query.get('key'):
+                return 403, b'{"error": "key required"}', 'application/json'
+            ids = sorted(cat.materials)[:20]
+            return self.json(cat.listing(ids, query.get('engine')))
+        if path.startswith('/media/images/'):
+            if self.image_tiers and 'size' in query:
+                return 200, self.image_tier(int(query['size'])), 'image/png'
+            return 200, self.image, 'image/png'
+        if path.startswith('/media/files/'):
+            return 200, self.library, 'application/octet-stream'
+        raise KeyError(path)
+
+    def category_listing(self, category, engine):
+        # built once, paged requests of big categories would redo it every time
+        key = (category, engine)
+        with self.lock:
+            if key not in self.listings:
+                self.listings[key] = self.catalogue.listing(self.catalogue.by_category[category], engine)
+            return self.listings[key]
+
+    def image_tier(self, size):
+        size = min(size, self.image_size)
+        with self.lock:
+            if size not in self.tiers:
+                self.tiers[size] = make_png(size)
+            return self.tiers[size]
+
+    def json(self, data):
+        return 200, json.dumps(data).encode('UTF-8'), 'application/json'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a fake Blendermada catalogue.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--bandwidth', type=int, default=0, help='bytes per second, 0 is unlimited')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='share of requests answered with 503')
+    parser.add_argument('--truncate-rate', type=float, default=0.0, help='share of bodies cut short')
+    parser.add_argument('--categories', type=int, default=10)
+    parser.add_argument('--materials', type=int, default=100, help='materials per category')
+    parser.add_argument('--image-size', type=int, default=128, help='thumbnail edge in pixels')
+    parser.add_argument('--library', help='.blend file served for every material')
+    parser.add_argument('--storage-name', default='Material', help='material name inside the library')
+    parser.add_argument('--no-gzip', action='store_true')
+    parser.add_argument('--cache-control', help='Cache-Control header for good answers, e.g. max-age=60')
+    parser.add_argument('--paging', action='store_true', help='serve material lists in pages when asked to')
+    parser.add_argument('--image-tiers', action='store_true', help='scale thumbnails down to the size asked for')
+    args = parser.parse_args()
+
+    server = MockServer(
+        args.host, args.port, args.latency, args.bandwidth, args.failure_rate,
+        args.truncate_rate, args.categories, args.materials, args.image_size,
+        args.library, storage_name=args.storage_name, use_gzip=not args.no_gzip,
+        cache_control=args.cache_control, paging=args.paging,
+        image_tiers=args.image_tiers, verbose=True,
+    )
+    server.start()
+    print('Serving a fake Blendermada on %s (Ctrl+C to stop)' % (server.url,))
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -33,39 +33,284 @@ bl_info = {
     "category": "Material",
 }
 
-from threading import Lock
+from threading import Condition, Event, Lock, Thread, current_thread, get_ident, local, main_thread
+from contextlib import contextmanager
 
 import bpy
-import bgl
-from bgl import Buffer as Buffer
 from bpy.props import *
-import gpu
-from gpu_extras.batch import batch_for_shader
 
-
-from urllib import request, parse
-import json
+# The network stack, json, gpu and the like are imported where they are
+# used, so enabling the add-on (and starting Blender) stays cheap.
+import bisect
+import fnmatch
+import functools
+import heapq
+import itertools
 import os
-import pickle
+import re
+import sys
 import time
-from datetime import datetime
+import zlib
 
 
 ENGINE_MAPPING = {
     'BLENDER_RENDER': 'int',
     'BLENDER_GAME': 'int',
     'CYCLES': 'cyc',
-    'EEVEE': 'eve',
+    'BLENDER_EEVEE': 'eve',
+    'BLENDER_EEVEE_NEXT': 'eve',
+    'BLENDER_WORKBENCH': 'eve',
 }
+# node materials made for Cycles are the safest bet for anything else
+DEFAULT_ENGINE = 'cyc'
+
+# Where the API lives unless the preferences name another server, like
+# a studio's LAN cache (tools/lan_server.py). Media URLs the site hands
+# out for its own hosts are sent there too.
+DEFAULT_BASE_URL = 'http://blendermada.com/'
+SITE_HOSTS = ('blendermada.com', 'www.blendermada.com')
+
+ACCEPT_ENCODING = 'gzip, deflate'
+READ_CHUNK_SIZE = 64 * 1024
+
+# Upper bounds in seconds of the latency histogram buckets, anything
+# slower goes into one more bucket at the end.
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+
+# Trace categories of the timed spans, anything else is 'ui'.
+TRACE_CATEGORIES = {
+    'http': 'network',
+    'load_data': 'cache',
+    'texture_upload': 'gpu',
+    'draw_preview': 'gpu',
+}
+# Spans kept by one profiling session at most.
+TRACE_MAX_EVENTS = 200000
+
+
+class Profiler(object):
+    # Support mode: while it runs, operators and update callbacks are
+    # recorded with cProfile and every timed span goes into a timeline
+    # in Chrome trace format (chrome://tracing, Perfetto).
+
+    def __init__(self):
+        self.lock = Lock()
+        self.profile = None
+        self.events = []
+        self.threads = {}
+        self.depth = 0
+        self.origin = 0.0
+
+    @property
+    def active(self):
+        return self.profile is not None
+
+    def start(self):
+        import cProfile
+        with self.lock:
+            self.events = []
+            self.threads = {}
+            self.depth = 0
+            self.origin = time.perf_counter()
+            self.profile = cProfile.Profile()
+
+    def enter(self):
+        # only the main thread runs operators and callbacks, and cProfile
+        # follows the thread it was enabled in
+        if self.profile is None or get_ident() != main_thread().ident:
+            return
+        if self.depth == 0:
+            try:
+                self.profile.enable()
+            except ValueError: # another profiler is already running
+                pass
+        self.depth += 1
+
+    def leave(self):
+        if self.profile is None or get_ident() != main_thread().ident or self.depth == 0:
+            return
+        self.depth -= 1
+        if self.depth == 0:
+            self.profile.disable()
+
+    def add_span(self, name, start, end):
+        thread = current_thread()
+        with self.lock:
+            if self.profile is None or len(self.events) >= TRACE_MAX_EVENTS:
+                return
+            self.threads[thread.ident] = thread.name
+            self.events.append({
+                'name': name,
+                'cat': TRACE_CATEGORIES.get(name, 'ui'),
+                'ph': 'X',
+                'ts': (start - self.origin) * 1e6,
+                'dur': (end - start) * 1e6,
+                'pid': os.getpid(),
+                'tid': thread.ident,
+            })
+
+    def stop(self, path):
+        # writes <stamp>.prof and <stamp>.trace.json into path
+        import json
+        with self.lock:
+            profile, self.profile = self.profile, None
+            events, threads = self.events, self.threads
+            self.events, self.threads = [], {}
+        if profile is None:
+            return []
+        if self.depth:
+            profile.disable()
+            self.depth = 0
+        if not os.path.exists(path):
+            os.mkdir(path)
+        stem = os.path.join(path, time.strftime('bmd-%Y%m%d-%H%M%S'))
+        profile.dump_stats(stem + '.prof')
+        for ident, name in threads.items():
+            events.append({
+                'name': 'thread_name',
+                'ph': 'M',
+                'pid': os.getpid(),
+                'tid': ident,
+                'args': {'name': name},
+            })
+        with open(stem + '.trace.json', 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return [stem + '.prof', stem + '.trace.json']
+
+
+profiler = Profiler()
+
+
+class Metrics(object):
+    # Timings, cache hits and byte counts of the hot paths, kept for the
+    # whole session. Cheap enough to be always on.
+
+    def __init__(self):
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.timings = {} # name -> [count, total, max, histogram]
+            self.cache = {} # resource -> [hits, misses]
+            self.bytes = {} # counter -> bytes
+
+    def observe(self, name, seconds):
+        with self.lock:
+            entry = self.timings.get(name)
+            if entry is None:
+                entry = self.timings[name] = [0, 0.0, 0.0, [0] * (len(LATENCY_BUCKETS) + 1)]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            entry[3][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    @contextmanager
+    def timer(self, name, profile=False):
+        # profile: also record the block with cProfile in profiling mode
+        if profile:
+            profiler.enter()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            if profile:
+                profiler.leave()
+            self.observe(name, end - start)
+            if profiler.active:
+                profiler.add_span(name, start, end)
+
+    def timed(self, name, profile=False):
+        # decorator version of timer()
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, profile):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def cache_lookup(self, resource, hit):
+        with self.lock:
+            entry = self.cache.setdefault(resource, [0, 0])
+            entry[0 if hit else 1] += 1
+
+    def add_bytes(self, counter, count):
+        with self.lock:
+            self.bytes[counter] = self.bytes.get(counter, 0) + count
+
+    def percentile(self, histogram, count, share):
+        # upper bound of the bucket the share-th call falls into
+        seen = 0
+        for bound, calls in zip(LATENCY_BUCKETS + (None,), histogram):
+            seen += calls
+            if seen >= count * share:
+                return bound
+        return None
+
+    def snapshot(self):
+        with self.lock:
+            timings = dict((k, (v[0], v[1], v[2], list(v[3]))) for k, v in self.timings.items())
+            cache = dict((k, list(v)) for k, v in self.cache.items())
+            counters = dict(self.bytes)
+        result = {'timings': {}, 'cache': {}, 'bytes': counters}
+        labels = ['<=%gms' % (bound * 1000,) for bound in LATENCY_BUCKETS]
+        labels.append('>%gms' % (LATENCY_BUCKETS[-1] * 1000,))
+        for name, (count, total, slowest, histogram) in sorted(timings.items()):
+            p50 = self.percentile(histogram, count, 0.5)
+            p95 = self.percentile(histogram, count, 0.95)
+            result['timings'][name] = {
+                'count': count,
+                'total_ms': total * 1000,
+                'avg_ms': total * 1000 / count,
+                'max_ms': slowest * 1000,
+                'p50_ms': None if p50 is None else p50 * 1000,
+                'p95_ms': None if p95 is None else p95 * 1000,
+                'histogram': dict(zip(labels, histogram)),
+            }
+        for resource, (hits, misses) in sorted(cache.items()):
+            result['cache'][resource] = {
+                'hits': hits,
+                'misses': misses,
+                'hit_ratio': hits / float(hits + misses),
+            }
+        return result
+
+
+metrics = Metrics()
+
+# Deadlines for a single attempt. The connect timeout covers name lookup
+# and TCP connect, the read timeout applies to every read on the socket.
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 30.0
+
+# Requests are retried with full jitter exponential backoff.
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+
+# After this many failures in a row a host is considered down and
+# requests to it fail immediately until the cool-down has passed.
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30.0
+
+# Every request waits for a connection slot and a token from its host's
+# bucket. Interactive requests always go first, bulk downloads last.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PREFETCH = 1
+PRIORITY_BULK = 2
+PRIORITY_NAMES = ('interactive', 'prefetch', 'bulk')
+
+MAX_CONNECTIONS = 4
+REQUESTS_PER_SECOND = 8.0
 
 
 ########################################################################
 ########################################################################
 
 
-#import gpu
-#from gpu_extras.batch import batch_for_shader
-
 GL_LINES = 0
 GL_LINE_STRIP = 1
 GL_LINE_LOOP = 2
@@ -189,6 +434,9 @@ def _get_transparency_shader():
 
 
 def glEnd():
+    import gpu
+    from gpu_extras.batch import batch_for_shader
+
     inst = InternalData.get_instance()
 
     color = inst.get_color()
@@ -274,42 +522,442 @@ def glTexCoord2f(u, v):
 ########################################################################
 
 
-def get_cache_path():
+# Worker threads must not read bpy.context. What they need from the
+# preferences is kept in module values: snapshot_settings() reads them on
+# the main thread before a thread starts, and the preference update
+# callbacks replace them with the new ones, also on the main thread.
+
+_cache_path = None
+
+def make_cache_path():
+    # the directories are set up once, not on every fetch
     path = bpy.context.preferences.addons[__name__].preferences.cache_path
-    if not os.path.exists(path):
-        os.mkdir(path)
     path = os.path.join(path, 'bmd_cache')
-    if not os.path.exists(path):
-        os.mkdir(path)
+    for folder in (path, os.path.join(path, 'images'), os.path.join(path, 'files')):
+        os.makedirs(folder, exist_ok=True)
     return path
 
-def dump_data(data, filepath):
-    with open(filepath, 'wb+') as f:
-        pickle.dump(data, f)
+def get_cache_path():
+    global _cache_path
+    if _cache_path is None:
+        _cache_path = make_cache_path()
+    return _cache_path
 
-def load_data(filepath):
-    with open(filepath, 'rb+') as f:
-        data = pickle.load(f)
+def reset_cache_path(self=None, context=None):
+    global _cache_path
+    try:
+        _cache_path = make_cache_path()
+    except OSError:
+        _cache_path = None # reported when the cache is next used
+
+# Cache files keep the raw JSON body as it came from the server, zlib
+# compressed when it is big enough to be worth it. Nothing is parsed until
+# somebody actually asks for the data, and parsed data is kept in memory
+# until the add-on writes the file again. Material lists and details are
+# not kept, the catalogue holds what they carry once it has indexed them.
+CACHE_COMPRESS_MIN_SIZE = 1024
+
+_loaded_data = {}
+
+def open_cache_file(filepath):
+    # for writing; the cache folders are made again when somebody cleared
+    # them while Blender runs, and what the index knew of them is dropped
+    try:
+        return open(filepath, 'wb+')
+    except FileNotFoundError:
+        folder = os.path.dirname(filepath)
+        os.makedirs(folder, exist_ok=True)
+        cache_index.forget_folder(folder)
+        return open(filepath, 'wb+')
+
+def dump_data(data, filepath):
+    if len(data) >= CACHE_COMPRESS_MIN_SIZE:
+        data = zlib.compress(data, 1)
+    with open_cache_file(filepath) as f:
+        f.write(data)
+    metrics.add_bytes('cache_written', len(data))
+    _loaded_data.pop(filepath, None)
+
+def load_data(filepath, keep=True):
+    if filepath in _loaded_data:
+        return _loaded_data[filepath]
+    with metrics.timer('load_data'):
+        with open(filepath, 'rb') as f:
+            raw = f.read()
+        metrics.add_bytes('cache_read', len(raw))
+        if raw[:1] == b'\x78': # zlib header, JSON never starts with 'x'
+            raw = zlib.decompress(raw)
+        import json
+        data = json.loads(str(raw, 'UTF-8'))
+    if keep:
+        _loaded_data[filepath] = data
     return data
 
-def file_expired(filepath, seconds_to_live):
-    if os.path.exists(filepath):
-        if time.mktime(datetime.now().timetuple()) - os.path.getmtime(filepath) < seconds_to_live:
-            return False
-    return True
+def cache_resource(filepath):
+    # what kind of thing a cache file holds, for the hit statistics
+    name = os.path.basename(filepath)
+    folder = os.path.basename(os.path.dirname(filepath))
+    if folder == 'images':
+        return 'images'
+    if folder == 'files':
+        return 'libraries'
+    if name.startswith('mat-'):
+        return 'details'
+    if name.endswith('cat-fav'):
+        return 'favorites'
+    return name
+
+# Seconds cached data stays fresh, per kind of resource (see
+# cache_resource()). Libraries and thumbnails do not change once they are
+# published, favorites change whenever the user likes something.
+DEFAULT_TTL = {
+    'categories': 24 * 3600,
+    'materials': 3600,
+    'details': 24 * 3600,
+    'favorites': 300,
+    'images': 30 * 24 * 3600,
+    'libraries': 30 * 24 * 3600,
+}
+
+_ttl_policy = None
+
+def make_ttl_policy():
+    addon_prefs = bpy.context.preferences.addons[__name__].preferences
+    return dict((name, getattr(addon_prefs, 'ttl_' + name) * 60) for name in DEFAULT_TTL)
+
+def get_ttl_policy():
+    global _ttl_policy
+    if _ttl_policy is None:
+        _ttl_policy = make_ttl_policy()
+    return _ttl_policy
+
+def get_ttl(resource):
+    return get_ttl_policy().get(resource, 300)
+
+def reset_ttl_policy(self=None, context=None):
+    global _ttl_policy
+    _ttl_policy = make_ttl_policy()
+
+def response_lifetime(r):
+    # seconds the response may be cached for, None if the server does not say
+    for directive in r.headers.get('Cache-Control', '').lower().split(','):
+        directive = directive.strip()
+        if directive in ('no-cache', 'no-store'):
+            return 0
+        if directive.startswith('max-age='):
+            try:
+                return max(0, int(directive[len('max-age='):]))
+            except ValueError:
+                pass
+    return None
+
+# Seconds between writes of a folder's 'meta' file while downloads keep
+# changing it, the rest is written by flush() when they are done.
+META_FLUSH_INTERVAL = 5.0
+
+class CacheIndex(object):
+    # Which cache files exist and when they were fetched, read once per
+    # folder, so a warm freshness check makes no file system calls.
+    # Lifetimes the server gave with Cache-Control win over the policy;
+    # they are kept in a 'meta' file in each folder.
+
+    def __init__(self):
+        self.lock = Lock()
+        self.flush_lock = Lock()
+        self.folders = set()
+        self.fetched = {} # filepath -> time it was written
+        self.expiry = {} # filepath -> time it goes stale, from the server
+        self.dirty = set() # folders whose meta file is behind
+        self.flushed = time.monotonic()
+
+    def load_folder(self, folder):
+        self.folders.add(folder)
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_file() and not entry.name.endswith('.part'):
+                        self.fetched[entry.path] = entry.stat().st_mtime
+        except OSError:
+            return
+        try:
+            meta = load_data(os.path.join(folder, 'meta'))
+        except (OSError, ValueError, zlib.error):
+            return
+        for name, expiry in meta.items():
+            filepath = os.path.join(folder, name)
+            if filepath in self.fetched:
+                self.expiry[filepath] = expiry
+
+    def flush(self, interval=0.0):
+        # Writes the meta files that are behind, unless that was done less
+        # than interval seconds ago. The disk is written outside the index
+        # lock, so lookups and downloads do not wait for it.
+        import json
+        if not self.flush_lock.acquire(blocking=interval == 0.0):
+            return # somebody else is writing
+        try:
+            with self.lock:
+                if not self.dirty or time.monotonic() - self.flushed < interval:
+                    return
+                self.flushed = time.monotonic()
+                metas = dict((folder, {}) for folder in self.dirty)
+                self.dirty = set()
+                for filepath, expiry in self.expiry.items():
+                    meta = metas.get(os.path.dirname(filepath))
+                    if meta is not None:
+                        meta[os.path.basename(filepath)] = expiry
+            for folder, meta in metas.items():
+                try:
+                    dump_data(json.dumps(meta).encode('UTF-8'), os.path.join(folder, 'meta'))
+                except OSError:
+                    pass # the lifetimes fall back to the policy
+        finally:
+            self.flush_lock.release()
+
+    def exists(self, filepath):
+        folder = os.path.dirname(filepath)
+        with self.lock:
+            if folder not in self.folders:
+                self.load_folder(folder)
+            return filepath in self.fetched
+
+    def version(self, filepath):
+        # changes whenever filepath is written, None if it is not cached
+        folder = os.path.dirname(filepath)
+        with self.lock:
+            if folder not in self.folders:
+                self.load_folder(folder)
+            return self.fetched.get(filepath)
+
+    def expired(self, filepath, seconds_to_live):
+        folder = os.path.dirname(filepath)
+        with self.lock:
+            if folder not in self.folders:
+                self.load_folder(folder)
+            fetched = self.fetched.get(filepath)
+            if fetched is None:
+                return True
+            expiry = self.expiry.get(filepath)
+        if expiry is None:
+            expiry = fetched + seconds_to_live
+        return time.time() >= expiry
+
+    def record(self, filepath, lifetime=None):
+        # filepath has just been written
+        folder = os.path.dirname(filepath)
+        now = time.time()
+        with self.lock:
+            if folder not in self.folders:
+                self.load_folder(folder)
+            self.fetched[filepath] = now
+            had_expiry = self.expiry.pop(filepath, None) is not None
+            if lifetime is not None:
+                self.expiry[filepath] = now + lifetime
+            if had_expiry or lifetime is not None:
+                self.dirty.add(folder)
+        self.flush(META_FLUSH_INTERVAL)
+
+    def forget(self, filepath):
+        # filepath has been removed
+        with self.lock:
+            self.fetched.pop(filepath, None)
+            if self.expiry.pop(filepath, None) is not None:
+                self.dirty.add(os.path.dirname(filepath))
+        _loaded_data.pop(filepath, None)
+        self.flush(META_FLUSH_INTERVAL)
+
+    def forget_folder(self, folder):
+        # folder was removed, it is scanned again when it is next used
+        with self.lock:
+            self.folders.discard(folder)
+            self.dirty.discard(folder)
+            for filepath in [filepath for filepath in self.fetched if os.path.dirname(filepath) == folder]:
+                del self.fetched[filepath]
+                self.expiry.pop(filepath, None)
+
+
+cache_index = CacheIndex()
+
+def cache_expired(filepath):
+    return cache_index.expired(filepath, get_ttl(cache_resource(filepath)))
+
+def still_cached(filepath):
+    # A fresh file that was removed behind the add-on's back is a miss.
+    # Only for files handed out by path, parsed data is read anyway.
+    if os.path.isfile(filepath):
+        return True
+    cache_index.forget(filepath)
+    return False
 
 ########################################################################
 ########################################################################
 
 
 def get_engine():
-    engine = bpy.context.scene.render.engine
+    return ENGINE_MAPPING.get(bpy.context.scene.render.engine, DEFAULT_ENGINE)
+
+class CircuitOpenError(ConnectionError):
+    pass
+
+
+class CircuitBreaker(object):
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.lock = Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                # half-open: let one probe through, everybody else still
+                # fails fast until it reports back
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+breakers = {}
+breakers_lock = Lock()
+
+def get_breaker(url):
+    from urllib import parse
+    host = parse.urlsplit(url).netloc
+    with breakers_lock:
+        if host not in breakers:
+            breakers[host] = CircuitBreaker()
+        return breakers[host]
+
+
+class RequestScheduler(object):
+
+    def __init__(self, max_connections=MAX_CONNECTIONS, rate=REQUESTS_PER_SECOND):
+        self.cond = Condition()
+        self.waiting = [] # sorted (priority, seq, host) tickets
+        self.seq = itertools.count()
+        self.active = 0
+        self.buckets = {} # host -> [tokens, last refill]
+        self.configure(max_connections, rate)
+        self.reset_stats()
+
+    def configure(self, max_connections, rate):
+        with self.cond:
+            self.max_connections = max(1, max_connections)
+            self.rate = max(0.1, rate)
+            self.burst = max(1.0, self.rate)
+            self.cond.notify_all()
+
+    def reset_stats(self):
+        with self.cond:
+            self.served = [0] * len(PRIORITY_NAMES)
+            self.wait_total = [0.0] * len(PRIORITY_NAMES)
+            self.wait_max = [0.0] * len(PRIORITY_NAMES)
+
+    def token_delay(self, host, now):
+        tokens, last = self.buckets.get(host, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        self.buckets[host] = [tokens, now]
+        if tokens >= 1.0:
+            return 0.0
+        return (1.0 - tokens) / self.rate
+
+    def next_ticket(self, now):
+        # the most important ticket whose host has a token to spend
+        soonest = None
+        for ticket in self.waiting:
+            delay = self.token_delay(ticket[2], now)
+            if delay == 0.0:
+                return ticket, None
+            soonest = delay if soonest is None else min(soonest, delay)
+        return None, soonest
+
+    @contextmanager
+    def slot(self, host, priority=PRIORITY_INTERACTIVE):
+        ticket = (priority, next(self.seq), host)
+        start = time.monotonic()
+        with self.cond:
+            bisect.insort(self.waiting, ticket)
+            while True:
+                timeout = None
+                if self.active < self.max_connections:
+                    chosen, timeout = self.next_ticket(time.monotonic())
+                    if chosen == ticket:
+                        break
+                self.cond.wait(timeout)
+            self.waiting.remove(ticket)
+            self.buckets[host][0] -= 1.0
+            self.active += 1
+            waited = time.monotonic() - start
+            self.served[priority] += 1
+            self.wait_total[priority] += waited
+            self.wait_max[priority] = max(self.wait_max[priority], waited)
+            self.cond.notify_all()
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.active -= 1
+                self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            queued = [0] * len(PRIORITY_NAMES)
+            for ticket in self.waiting:
+                queued[ticket[0]] += 1
+            return {
+                'active': self.active,
+                'max_connections': self.max_connections,
+                'requests_per_second': self.rate,
+                'queues': {
+                    name: {
+                        'queued': queued[i],
+                        'served': self.served[i],
+                        'wait_avg': self.wait_total[i] / self.served[i] if self.served[i] else 0.0,
+                        'wait_max': self.wait_max[i],
+                    } for i, name in enumerate(PRIORITY_NAMES)
+                },
+            }
+
+
+scheduler = RequestScheduler()
+
+_request_local = local()
+
+@contextmanager
+def request_priority(priority):
+    # requests made by this thread inside the block use the given priority
+    previous = get_request_priority()
+    _request_local.priority = priority
     try:
-        return ENGINE_MAPPING[engine]
-    except:
-        return ''
+        yield
+    finally:
+        _request_local.priority = previous
+
+def get_request_priority():
+    return getattr(_request_local, 'priority', PRIORITY_INTERACTIVE)
+
 
 def get_proxy_handlers():
+    from urllib import request
     handlers = []
     addon_prefs = bpy.context.preferences.addons[__name__].preferences
     if addon_prefs.proxy_use_proxy:
@@ -324,78 +972,1153 @@ def get_proxy_handlers():
             pass
     return handlers
 
+_opener = None
+
+def make_opener():
+    from http import client
+    from urllib import request
+
+    # the connect timeout is given to open(), every read after that
+    # gets its own deadline
+    class BMDHTTPConnection(client.HTTPConnection):
+
+        def connect(self):
+            super().connect()
+            self.sock.settimeout(READ_TIMEOUT)
+
+    class BMDHTTPSConnection(client.HTTPSConnection):
+
+        def connect(self):
+            super().connect()
+            self.sock.settimeout(READ_TIMEOUT)
+
+    class BMDHTTPHandler(request.HTTPHandler):
+
+        def http_open(self, req):
+            return self.do_open(BMDHTTPConnection, req)
+
+    class BMDHTTPSHandler(request.HTTPSHandler):
+
+        def https_open(self, req):
+            return self.do_open(BMDHTTPSConnection, req, context=self._context)
+
+    return request.build_opener(
+        BMDHTTPHandler(),
+        BMDHTTPSHandler(),
+        *get_proxy_handlers()
+    )
+
+def get_opener():
+    global _opener
+    if _opener is None:
+        _opener = make_opener()
+    return _opener
+
+def reset_opener(self=None, context=None):
+    # the new connection settings replace the old ones, never None
+    # in between for a thread to stumble on
+    global _opener, _base_url, _routes
+    base_url = make_base_url()
+    _opener, _base_url, _routes = make_opener(), base_url, make_routes(base_url)
+
+def snapshot_settings():
+    # main thread, before starting threads that fetch
+    get_opener()
+    get_routes()
+    get_ttl_policy()
+    get_cache_path()
+
+_base_url = None
+
+def as_base_url(url):
+    url = url.strip()
+    return url if url.endswith('/') else url + '/'
+
+def make_base_url():
+    url = bpy.context.preferences.addons[__name__].preferences.base_url.strip()
+    return as_base_url(url or DEFAULT_BASE_URL)
+
+def get_base_url():
+    global _base_url
+    if _base_url is None:
+        _base_url = make_base_url()
+    return _base_url
+
+# Weight of the newest sample in the moving average of mirror latency.
+LATENCY_SMOOTHING = 0.3
+
+
+class Endpoint(object):
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.latency = None # moving average of time to response headers
+        self.requests = 0
+        self.failures = 0
+        self.lock = Lock()
+
+    @property
+    def breaker(self):
+        return get_breaker(self.base_url)
+
+    def success(self, latency):
+        with self.lock:
+            self.requests += 1
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += LATENCY_SMOOTHING * (latency - self.latency)
+
+    def failure(self):
+        with self.lock:
+            self.requests += 1
+            self.failures += 1
+
+
+class EndpointPool(object):
+    # Servers that answer the same paths. Healthy ones are tried fastest
+    # first, ones without a measurement before that so each gets probed.
+
+    def __init__(self, base_urls):
+        self.endpoints = [Endpoint(url) for url in base_urls]
+
+    def ranked(self):
+        return sorted(self.endpoints, key=lambda e: (
+            e.breaker.is_open,
+            -1.0 if e.latency is None else e.latency,
+        ))
+
+    def stats(self):
+        return [{
+            'url': e.base_url,
+            'latency_ms': None if e.latency is None else e.latency * 1000,
+            'requests': e.requests,
+            'failures': e.failures,
+            'down': e.breaker.is_open,
+        } for e in self.endpoints]
+
+
+_routes = None
+
+def make_routes(base_url):
+    # {'api': pool, 'media': pool}, media uses the API servers unless
+    # separate media mirrors are set
+    addon_prefs = bpy.context.preferences.addons[__name__].preferences
+    api = [base_url] + [as_base_url(url) for url in addon_prefs.mirrors.split(',') if url.strip()]
+    media = [as_base_url(url) for url in addon_prefs.media_mirrors.split(',') if url.strip()]
+    api_pool = EndpointPool(api)
+    return {'api': api_pool, 'media': EndpointPool(media) if media else api_pool}
+
+def get_routes():
+    global _routes
+    if _routes is None:
+        _routes = make_routes(get_base_url())
+    return _routes
+
+def route_url(url):
+    # [(endpoint, full url)] to try for url, best first; endpoint is None
+    # for servers that are not ours
+    from urllib import parse
+    routes = get_routes()
+    parts = parse.urlsplit(url)
+    if parts.netloc:
+        ours = set(SITE_HOSTS)
+        for pool in routes.values():
+            ours.update(parse.urlsplit(e.base_url).hostname for e in pool.endpoints)
+        if parts.hostname not in ours:
+            return [(None, url)]
+        url = parse.urlunsplit(('', '', parts.path, parts.query, ''))
+    # relative to the base, so a base URL with a path keeps it
+    path = url.lstrip('/')
+    pool = routes['media'] if path.startswith('media/') else routes['api']
+    return [(e, parse.urljoin(e.base_url, path)) for e in pool.ranked()]
+
+def resolve_url(url):
+    return route_url(url)[0][1]
+
+def get_endpoint_stats():
+    routes = get_routes()
+    stats = {'api': routes['api'].stats()}
+    if routes['media'] is not routes['api']:
+        stats['media'] = routes['media'].stats()
+    return stats
+
 def bmd_urlopen(url, **kwargs):
-    full_url = parse.urljoin('http://blendermada.com/', url)
+    # full URLs are opened as they are, paths go to the best server
+    from urllib import parse, request
+    full_url = url if parse.urlsplit(url).netloc else resolve_url(url)
     params = parse.urlencode(kwargs)
-    handlers = get_proxy_handlers()
-    opener = request.build_opener(*handlers)
-    request.install_opener(opener)
-    return request.urlopen('%s?%s' % (full_url, params))
-
-def get_materials(category):
-    engine = get_engine()
-    filepath = os.path.join(get_cache_path(), '{}-cat-{}'.format(engine, category))
-    if file_expired(filepath, 300):
-        r = bmd_urlopen(
-            '/api/materials/materials.json',
-            engine=engine,
-            category=category,
-        )
-        ans = json.loads(str(r.read(), 'UTF-8'))
-        dump_data(ans, filepath)
-    return load_data(filepath)
-
-def get_favorites():
-    engine = get_engine()
-    filepath = os.path.join(get_cache_path(), '{}-cat-fav'.format(engine))
-    if file_expired(filepath, 300):
-        addon_prefs = bpy.context.preferences.addons[__name__]
-        r = bmd_urlopen(
-            '/api/materials/v1/favorites.json',
-            engine=engine,
-            key=addon_prefs.preferences.api_key,
-        )
-        ans = json.loads(str(r.read(), 'UTF-8'))
-        dump_data(ans, filepath)
-    return load_data(filepath)
-
-def get_categories():
-    filepath = os.path.join(get_cache_path(), 'categories')
-    if file_expired(filepath, 300):
-        r = bmd_urlopen('/api/materials/categories.json')
-        ans = json.loads(str(r.read(), 'UTF-8'))
-        dump_data(ans, filepath)
-    return load_data(filepath)
-
-def get_material_detail(id):
-    filepath = os.path.join(get_cache_path(), 'mat-%s' % (id,))
-    if file_expired(filepath, 300):
-        r = bmd_urlopen('/api/materials/material.json', id=id)
-        ans = json.loads(str(r.read(), 'UTF-8'))
-        dump_data(ans, filepath)
-    return load_data(filepath)
-
-def get_image(url):
-    filepath = os.path.join(get_cache_path(), 'images')
-    if not os.path.exists(filepath):
-        os.mkdir(filepath)
-    filepath = os.path.join(filepath, url.split('/')[-1])
-    if file_expired(filepath, 300):
-        r = bmd_urlopen(url)
-        with open(filepath, 'wb+') as f:
-            f.write(r.read())
+    req = request.Request(
+        '%s?%s' % (full_url, params),
+        headers={'Accept-Encoding': ACCEPT_ENCODING},
+    )
+    return get_opener().open(req, timeout=CONNECT_TIMEOUT)
+
+# Everything that can go wrong on the way is an OSError: urllib errors
+# already are, bmd_fetch() converts the http.client ones.
+NETWORK_ERRORS = (OSError,)
+
+def as_network_error(e):
+    from http import client
+    if isinstance(e, client.HTTPException) and not isinstance(e, OSError):
+        return ConnectionError('%s: %s' % (type(e).__name__, e))
+    return e
+
+def is_transport_error(e):
+    # Failures of the server or of the way to it. Errors of the local
+    # file system (a full disk, a read-only cache) are none of them and
+    # must not count against the server.
+    import socket
+    import ssl
+    from urllib import error
+    return isinstance(e, (
+        error.URLError,
+        ConnectionError,
+        socket.timeout,
+        socket.gaierror,
+        socket.herror,
+        ssl.SSLError,
+    ))
+
+def is_retryable(e):
+    from urllib import error
+    if isinstance(e, error.HTTPError):
+        return e.code >= 500 or e.code == 429
+    return is_transport_error(e)
+
+# Opens url and passes the response to consume(), retrying on failures.
+# Only for idempotent requests: consume() may run more than once.
+# Every attempt goes to the next mirror, so a failing one is skipped
+# right away; the backoff only applies once all of them have been tried.
+def bmd_fetch(url, consume, **kwargs):
+    import random
+    from urllib import parse
+    candidates = route_url(url)
+    for attempt in range(RETRY_ATTEMPTS):
+        turn = attempt % len(candidates)
+        for endpoint, full_url in candidates[turn:] + candidates[:turn]:
+            breaker = get_breaker(full_url)
+            if breaker.allow():
+                break
+        else:
+            raise CircuitOpenError('server is not responding, try again later')
+        host = parse.urlsplit(full_url).netloc
+        try:
+            with scheduler.slot(host, get_request_priority()), metrics.timer('http'):
+                start = time.perf_counter()
+                r = bmd_urlopen(full_url, **kwargs)
+                latency = time.perf_counter() - start
+                try:
+                    result = consume(r)
+                finally:
+                    r.close()
+        except Exception as e:
+            failure = as_network_error(e)
+            if not is_retryable(failure):
+                if is_transport_error(failure):
+                    breaker.success() # the server answered, it is alive
+                raise
+            breaker.failure()
+            if endpoint is not None:
+                endpoint.failure()
+            if attempt + 1 == RETRY_ATTEMPTS or all(get_breaker(u).is_open for _, u in candidates):
+                if failure is e:
+                    raise
+                raise failure from e
+            if (attempt + 1) % len(candidates) == 0:
+                time.sleep(random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)))
+        else:
+            breaker.success()
+            if endpoint is not None:
+                endpoint.success(latency)
+            return result
+
+def get_decompressor(encoding, head):
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        # "deflate" should be zlib-wrapped, but plenty of servers send raw
+        # deflate streams, so look at the header to tell them apart
+        if len(head) >= 2 and head[0] & 0x0f == 8 and (head[0] << 8 | head[1]) % 31 == 0:
+            return zlib.decompressobj(zlib.MAX_WBITS)
+        return zlib.decompressobj(-zlib.MAX_WBITS)
+    return None
+
+def iter_response(r, chunk_size=READ_CHUNK_SIZE, progress=None):
+    encoding = r.headers.get('Content-Encoding', 'identity').strip().lower()
+    total = int(r.headers.get('Content-Length') or 0)
+    decompressor = None
+    wire_bytes = decoded_bytes = 0
+    try:
+        while True:
+            chunk = r.read(chunk_size)
+            if not chunk:
+                if total and wire_bytes != total:
+                    raise ConnectionError('connection closed after %d of %d bytes' % (wire_bytes, total))
+                break
+            wire_bytes += len(chunk)
+            if progress is not None:
+                progress(wire_bytes, total)
+            if decompressor is None and encoding != 'identity':
+                decompressor = get_decompressor(encoding, chunk)
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            decoded_bytes += len(chunk)
+            if chunk:
+                yield chunk
+        if decompressor is not None:
+            chunk = decompressor.flush()
+            decoded_bytes += len(chunk)
+            if chunk:
+                yield chunk
+    finally:
+        metrics.add_bytes('wire', wire_bytes)
+        metrics.add_bytes('decoded', decoded_bytes)
+
+def read_response(r):
+    return b''.join(iter_response(r))
+
+def save_response(r, filepath, progress=None):
+    # never leave a half written file behind under the real name
+    partpath = filepath + '.part'
+    try:
+        with open_cache_file(partpath) as f:
+            for chunk in iter_response(r, progress=progress):
+                f.write(chunk)
+                metrics.add_bytes('cache_written', len(chunk))
+    except BaseException:
+        try:
+            os.remove(partpath)
+        except OSError:
+            pass # never opened, keep the error that stopped it
+        raise
+    os.replace(partpath, filepath)
+
+class SingleFlight(object):
+    # Runs a function at most once at a time per key. Whoever asks for a
+    # key that is already in flight waits for it and shares the outcome.
+
+    class Call(object):
+
+        def __init__(self):
+            self.done = Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.lock = Lock()
+        self.calls = {}
+
+    def do(self, key, func):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = self.Call()
+        if leader:
+            try:
+                call.result = func()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+flight = SingleFlight()
+
+def download_json(filepath, url, params):
+    if not cache_expired(filepath):
+        return # fetched by somebody else in the meantime
+    try:
+        data, lifetime = bmd_fetch(url, lambda r: (read_response(r), response_lifetime(r)), **params)
+        dump_data(data, filepath)
+        cache_index.record(filepath, lifetime)
+    except NETWORK_ERRORS:
+        if not cache_index.exists(filepath):
+            raise
+        # offline: stale data is better than nothing
+
+def download_file(filepath, url, progress=None, **kwargs):
+    # returns the lifetime the server gave, if it did
+    if not cache_expired(filepath):
+        return None
+    try:
+        lifetime = bmd_fetch(url, lambda r: (save_response(r, filepath, progress), response_lifetime(r))[1], **kwargs)
+        cache_index.record(filepath, lifetime)
+    except NETWORK_ERRORS:
+        if not cache_index.exists(filepath):
+            raise
+        return None
+    return lifetime
+
+def fetch_json(filepath, url, keep=True, **kwargs):
+    if not cache_expired(filepath):
+        try:
+            data = load_data(filepath, keep)
+        except (OSError, ValueError, zlib.error): # gone, damaged, or pickle from older versions
+            try:
+                os.remove(filepath)
+            except OSError:
+                pass
+            cache_index.forget(filepath)
+        else:
+            metrics.cache_lookup(cache_resource(filepath), True)
+            return data
+    metrics.cache_lookup(cache_resource(filepath), False)
+    flight.do(filepath, lambda: download_json(filepath, url, kwargs))
+    return load_data(filepath, keep)
+
+def cached_json(filepath, keep=True):
+    # what the cache holds, stale or not, None if nothing; never the network
+    if not cache_index.exists(filepath):
+        return None
+    try:
+        return load_data(filepath, keep)
+    except (OSError, ValueError, zlib.error):
+        return None
+
+def fetch_file(filepath, url, progress=None):
+    expired = cache_expired(filepath) or not still_cached(filepath)
+    metrics.cache_lookup(cache_resource(filepath), not expired)
+    if expired:
+        flight.do(filepath, lambda: download_file(filepath, url, progress))
     return filepath
 
+# Material lists are stored once per category, merged over all engines.
+# Which of them work with an engine is kept in a small index, so switching
+# the render engine only filters what is already there.
+_engine_index = {}
+_engine_index_lock = Lock()
+_engine_views = {}
+
+def get_engine_index(path):
+    with _engine_index_lock:
+        if path not in _engine_index:
+            try:
+                _engine_index[path] = load_data(os.path.join(path, 'engines'))
+            except (OSError, ValueError, zlib.error):
+                _engine_index[path] = {}
+        return _engine_index[path]
+
+def read_json(r):
+    import json
+    return json.loads(str(read_response(r), 'UTF-8'))
+
+def list_expired(entry):
+    # the engine index keeps the server's max-age with the list, if any
+    max_age = entry.get('max_age')
+    if max_age is None:
+        max_age = get_ttl('materials')
+    return time.time() - entry['fetched'] >= max_age
+
+# Material lists are asked for a page at a time. The first page is shown
+# right away, the others are loaded by a background thread and the whole
+# list goes to the cache once the last page has arrived. Servers without
+# paging ignore the page arguments and send the whole list at once.
+MATERIALS_PAGE_SIZE = 100
+
+_page_loads = {}
+_page_loads_lock = Lock()
+
+def read_page(r):
+    # (materials, more pages to come, lifetime)
+    data = read_json(r)
+    if isinstance(data, list):
+        return data, False, response_lifetime(r)
+    return data['results'], bool(data.get('next')), response_lifetime(r)
+
+def fetch_materials_page(engine, category, page):
+    return bmd_fetch(
+        '/api/materials/materials.json',
+        read_page,
+        engine=engine,
+        category=category,
+        page=page,
+        page_size=MATERIALS_PAGE_SIZE,
+    )
+
+def merge_materials(path, engine, category, mats, lifetime=None):
+    # stores a complete list in the shared file and the engine index
+    import json
+    filepath = os.path.join(path, 'cat-%s' % (category,))
+    with _engine_index_lock:
+        try:
+            shared = load_data(filepath, keep=False)
+        except (OSError, ValueError, zlib.error):
+            shared = []
+        fresh_ids = set(mat['id'] for mat in mats)
+        shared = [mat for mat in shared if mat['id'] not in fresh_ids] + mats
+        dump_data(json.dumps(shared).encode('UTF-8'), filepath)
+        cache_index.record(filepath)
+        index = _engine_index[path]
+        index.setdefault(engine, {})[str(category)] = {
+            'ids': [mat['id'] for mat in mats],
+            'fetched': time.time(),
+            'max_age': lifetime,
+        }
+        dump_data(json.dumps(index).encode('UTF-8'), os.path.join(path, 'engines'))
+
+class PageLoad(object):
+    # A category list coming in page by page. Only the thread appends to
+    # mats and ids, everybody else reads the ids that have arrived so far.
+    # The materials themselves go to the cache when the list is complete.
+
+    def __init__(self, path, engine, category, mats, lifetime):
+        self.path = path
+        self.engine = engine
+        self.category = category
+        self.mats = list(mats)
+        self.ids = [mat['id'] for mat in mats]
+        self.lifetime = lifetime
+        self.done = False
+        self.error = None
+        self.thread = Thread(target=self.run, daemon=True)
+
+    def run(self):
+        seen = set(self.ids)
+        page = 2
+        with request_priority(PRIORITY_PREFETCH):
+            try:
+                while True:
+                    mats, more, _ = fetch_materials_page(self.engine, self.category, page)
+                    mats = [mat for mat in mats if mat['id'] not in seen]
+                    seen.update(mat['id'] for mat in mats)
+                    catalogue.extend_category(self.category, mats)
+                    self.mats.extend(mats)
+                    self.ids.extend(mat['id'] for mat in mats)
+                    if not more:
+                        break
+                    page += 1
+                merge_materials(self.path, self.engine, self.category, self.mats, self.lifetime)
+            except NETWORK_ERRORS as e:
+                self.error = e # nothing is cached, the list is fetched again when it is next used
+            finally:
+                self.done = True
+                cache_index.flush()
+
+    def loading(self):
+        # whether more pages are coming, raises what stopped them
+        if self.error is not None:
+            raise self.error
+        return not self.done
+
+def running_page_load(path, engine, category):
+    key = (path, engine, category)
+    with _page_loads_lock:
+        load = _page_loads.get(key)
+        if load is not None and load.done:
+            del _page_loads[key]
+            return None
+        return load
+
+def download_materials(path, engine, category):
+    entry = get_engine_index(path).get(engine, {}).get(str(category))
+    if entry is not None and not list_expired(entry):
+        return # fetched by somebody else in the meantime
+    if running_page_load(path, engine, category) is not None:
+        return
+    mats, more, lifetime = fetch_materials_page(engine, category, 1)
+    if not more:
+        merge_materials(path, engine, category, mats, lifetime)
+        return
+    load = PageLoad(path, engine, category, mats, lifetime)
+    source = '%s-%s' % (os.path.join(path, 'cat-%s' % (category,)), engine)
+    catalogue.add_materials(source, list(mats), category)
+    with _page_loads_lock:
+        _page_loads[(path, engine, category)] = load
+    load.thread.start()
+
+# The get_* fetchers take the engine and cache directory from the current
+# context unless they are given. Background threads have to pass them.
+
+def get_materials(category, engine=None, path=None, wait=False):
+    # Ids of the materials, the catalogue has the rest. While the pages of
+    # a list are coming in, this is the list they are added to, so it
+    # grows. With wait the complete list is returned.
+    engine = engine or get_engine()
+    path = path or get_cache_path()
+    load = running_page_load(path, engine, category)
+    if load is None:
+        filepath = os.path.join(path, 'cat-%s' % (category,))
+        entry = get_engine_index(path).get(engine, {}).get(str(category))
+        expired = entry is None or list_expired(entry) or not cache_index.exists(filepath)
+        metrics.cache_lookup('materials', not expired)
+        if expired:
+            try:
+                flight.do(filepath + engine, lambda: download_materials(path, engine, category))
+            except NETWORK_ERRORS:
+                if entry is None or not cache_index.exists(filepath):
+                    raise
+            load = running_page_load(path, engine, category)
+    if load is not None:
+        if not wait:
+            return load.ids
+        load.thread.join()
+    return cached_materials(category, engine, path)
+
+def cached_materials(category, engine, path):
+    # ids of what the cache holds for the category, without the network;
+    # the shared file is only read again when it or the entry changed
+    entry = get_engine_index(path).get(engine, {}).get(str(category))
+    if entry is None:
+        return []
+    filepath = os.path.join(path, 'cat-%s' % (category,))
+    version = (cache_index.version(filepath), entry['fetched'])
+    view = _engine_views.get((engine, category))
+    if view is None or view[0] != version:
+        shared = cached_json(filepath, keep=False)
+        if shared is None:
+            return []
+        by_id = dict((mat['id'], mat) for mat in shared)
+        mats = [by_id[id] for id in entry['ids'] if id in by_id]
+        catalogue.add_materials('%s-%s' % (filepath, engine), mats, category, version)
+        view = _engine_views[(engine, category)] = (version, [mat['id'] for mat in mats])
+    return view[1]
+
+def cached_favorites(engine, path):
+    filepath = os.path.join(path, '{}-cat-fav'.format(engine))
+    mats = cached_json(filepath) or []
+    catalogue.add_materials(filepath, mats, version=cache_index.version(filepath))
+    return [mat['id'] for mat in mats]
+
+def get_favorites(engine=None, path=None, key=None):
+    engine = engine or get_engine()
+    filepath = os.path.join(path or get_cache_path(), '{}-cat-fav'.format(engine))
+    if key is None:
+        key = bpy.context.preferences.addons[__name__].preferences.api_key
+    mats = fetch_json(
+        filepath,
+        '/api/materials/v1/favorites.json',
+        engine=engine,
+        key=key,
+    )
+    catalogue.add_materials(filepath, mats, version=cache_index.version(filepath))
+    return [mat['id'] for mat in mats]
+
+def get_categories(path=None):
+    filepath = os.path.join(path or get_cache_path(), 'categories')
+    return fetch_json(filepath, '/api/materials/categories.json')
+
+def get_material_detail(id, path=None):
+    # Details live in the catalogue once they are read, the dict is made
+    # from the material's record, so it has the same fields whether it
+    # was just downloaded or not. tools/lan_server.py serves the cached
+    # body instead, it has everything the server sent.
+    filepath = os.path.join(path or get_cache_path(), 'mat-%s' % (id,))
+    if not cache_expired(filepath):
+        mat = catalogue.detail(filepath, id, cache_index.version(filepath))
+        if mat is not None:
+            metrics.cache_lookup('details', True)
+            return mat
+    mat = fetch_json(filepath, '/api/materials/material.json', keep=False, id=id)
+    return catalogue.add_detail(filepath, mat, cache_index.version(filepath))
+
+def cached_detail(id, path):
+    # the cached detail, stale or not, None if nothing; never the network
+    filepath = os.path.join(path, 'mat-%s' % (id,))
+    version = cache_index.version(filepath)
+    mat = catalogue.detail(filepath, id, version)
+    if mat is None:
+        mat = cached_json(filepath, keep=False)
+        if mat is not None:
+            mat = catalogue.add_detail(filepath, mat, version)
+    return mat
+
+# Thumbnails come in tiers: the list and the small preview use a small
+# tier, the full image is only fetched for the big preview. Tiers are
+# asked from the server with a size argument. Servers without them send
+# the full image, which is kept as such, and the tier is scaled down
+# from it by make_image_tier() on the main thread.
+THUMBNAIL_SIZE = 128
+
+# host -> whether it answered with a tier the last time
+_image_tiers = {}
+
+def image_tier_path(filepath, size):
+    root, ext = os.path.splitext(filepath)
+    return '%s.%d%s' % (root, size, ext)
+
+def image_host(url):
+    from urllib import parse
+    return parse.urlsplit(resolve_url(url)).netloc
+
+def get_image(url, path=None, size=None):
+    # Path of the full image, or of the tier with size pixel edges. Other
+    # threads than the main one get the full image until the tier is made.
+    filepath = os.path.join(path or get_cache_path(), 'images', url.split('/')[-1])
+    if size is None:
+        return fetch_file(filepath, url)
+    tier_path = image_tier_path(filepath, size)
+    expired = cache_expired(tier_path) or not still_cached(tier_path)
+    metrics.cache_lookup('images', not expired)
+    if not expired:
+        return tier_path
+    if _image_tiers.get(image_host(url)) is False:
+        fetch_file(filepath, url)
+    else:
+        try:
+            flight.do(tier_path, lambda: download_image_tier(tier_path, filepath, url, size))
+        except NETWORK_ERRORS:
+            if not cache_index.exists(filepath):
+                raise # nothing to make the tier from
+    if cache_index.exists(tier_path):
+        return tier_path
+    if current_thread() is not main_thread():
+        return filepath
+    return make_image_tier(filepath, size)
+
+def download_image_tier(tier_path, filepath, url, size):
+    if not cache_expired(tier_path):
+        return
+    lifetime = download_file(tier_path, url, size=size)
+    dimensions = image_dimensions(tier_path)
+    made = dimensions is not None and max(dimensions) <= size
+    _image_tiers[image_host(url)] = made
+    if not made: # the full image, keep it as that
+        os.replace(tier_path, filepath)
+        cache_index.forget(tier_path)
+        cache_index.record(filepath, lifetime)
+
+def cached_image(url, path=None, size=None):
+    # like get_image() from the cache only, None if it has nothing
+    filepath = os.path.join(path or get_cache_path(), 'images', url.split('/')[-1])
+    tier_path = image_tier_path(filepath, size) if size is not None else None
+    if tier_path is not None and cache_index.exists(tier_path) and still_cached(tier_path):
+        return tier_path
+    if not cache_index.exists(filepath) or not still_cached(filepath):
+        return None
+    if size is None:
+        return filepath
+    return make_image_tier(filepath, size)
+
+def image_dimensions(filepath):
+    # (width, height) of a PNG or JPEG from its header, None for others
+    import struct
+    with open(filepath, 'rb') as f:
+        head = f.read(64 * 1024)
+    if head[:8] == b'\x89PNG\r\n\x1a\n' and head[12:16] == b'IHDR':
+        return struct.unpack('>II', head[16:24])
+    if head[:2] != b'\xff\xd8':
+        return None
+    i = 2
+    while i + 9 <= len(head) and head[i] == 0xFF:
+        marker = head[i + 1]
+        length = struct.unpack('>H', head[i + 2:i + 4])[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack('>HH', head[i + 5:i + 9])
+            return width, height
+        i += 2 + length
+    return None
+
+def make_image_tier(filepath, size):
+    # main thread, scales a full image down to the tier and caches it
+    tier_path = image_tier_path(filepath, size)
+    if not cache_expired(tier_path):
+        return tier_path
+    with metrics.timer('image_tier'):
+        image = bpy.data.images.load(filepath)
+        try:
+            width, height = image.size
+            scale = float(size) / max(width, height, 1)
+            if scale < 1.0:
+                image.scale(max(1, round(width * scale)), max(1, round(height * scale)))
+            image.filepath_raw = tier_path + '.part'
+            image.file_format = 'JPEG' if tier_path.lower().endswith(('.jpg', '.jpeg')) else 'PNG'
+            image.save()
+        finally:
+            bpy.data.images.remove(image)
+    os.replace(tier_path + '.part', tier_path)
+    cache_index.record(tier_path)
+    return tier_path
+
+def get_library_path(url):
+    return os.path.join(get_cache_path(), 'files', url.split('/')[-1])
+
 def get_library(url):
-    filepath = os.path.join(get_cache_path(), 'files')
-    if not os.path.exists(filepath):
-        os.mkdir(filepath)
-    filepath = os.path.join(filepath, url.split('/')[-1])
-    if file_expired(filepath, 300):
-        r = bmd_urlopen(url)
-        with open(filepath, 'wb+') as f:
-            f.write(r.read())
-    return filepath
+    return fetch_file(get_library_path(url), url)
+
+def fetch_bulk(filepath, url, progress=None):
+    # Whole libraries hold a connection until the last byte is in, so
+    # the background and batch downloads let every other request go first.
+    with request_priority(PRIORITY_BULK):
+        return fetch_file(filepath, url, progress)
+
+def get_libraries(urls):
+    # download several libraries at once, returns {url: filepath}
+    from concurrent.futures import ThreadPoolExecutor
+    snapshot_settings()
+    with ThreadPoolExecutor(max_workers=scheduler.max_connections) as executor:
+        futures = dict(
+            (url, executor.submit(fetch_bulk, get_library_path(url), url)) for url in urls
+        )
+    return dict((url, future.result()) for url, future in futures.items())
+
+BLEND_FILE_MAGIC = (
+    b'BLENDER', # plain
+    b'\x1f\x8b', # gzip compressed
+    b'\x28\xb5\x2f\xfd', # zstd compressed
+)
+
+def verify_library(filepath):
+    with open(filepath, 'rb') as f:
+        head = f.read(7)
+    if not head.startswith(BLEND_FILE_MAGIC):
+        os.remove(filepath) # get a fresh copy next time
+        cache_index.forget(filepath)
+        raise ValueError('downloaded file is not a .blend file')
+
+
+class DownloadCancelled(Exception):
+    pass
+
+
+class DownloadItem(object):
+
+    def __init__(self, url, filepath):
+        self.url = url
+        self.filepath = filepath
+        self.name = url.split('/')[-1]
+        self.state = 'QUEUED' # RUNNING, DONE, FAILED or CANCELLED
+        self.received = 0
+        self.total = 0
+        self.error = None
+        self.cancelled = Event()
+        self.users = 0 # operators waiting for it
+
+    @property
+    def progress(self):
+        if self.total:
+            return self.received / self.total
+        return 0.0
+
+    @property
+    def finished(self):
+        return self.state in ('DONE', 'FAILED', 'CANCELLED')
+
+    def report_progress(self, received, total):
+        if self.cancelled.is_set():
+            raise DownloadCancelled()
+        self.received = received
+        self.total = total
+
+
+class DownloadQueue(object):
+    # Downloads libraries in background threads. Everything touching
+    # Blender data is left to the main thread, which polls the items.
+    # Operators asking for the same file share its item, each releases
+    # it when it is done; the download is only cancelled when the last
+    # one waiting for it gives up.
+
+    def __init__(self, workers=2):
+        self.lock = Lock()
+        self.items = {} # filepath -> DownloadItem
+        self.workers = workers
+        self.executor = None
+
+    def add(self, url, filepath):
+        snapshot_settings()
+        with self.lock:
+            item = self.items.get(filepath)
+            if item is None or item.finished:
+                item = self.items[filepath] = DownloadItem(url, filepath)
+                if self.executor is None:
+                    from concurrent.futures import ThreadPoolExecutor
+                    self.executor = ThreadPoolExecutor(max_workers=self.workers)
+                self.executor.submit(self.run, item)
+            item.users += 1
+        return item
+
+    def run(self, item):
+        if item.cancelled.is_set():
+            return
+        item.state = 'RUNNING'
+        try:
+            fetch_bulk(item.filepath, item.url, item.report_progress)
+            verify_library(item.filepath)
+        except DownloadCancelled:
+            state = 'CANCELLED'
+        except Exception as e:
+            item.error = e
+            state = 'FAILED'
+        else:
+            state = 'DONE'
+        if not item.cancelled.is_set():
+            item.state = state
+
+    def release(self, item, cancel=False):
+        # the caller stops waiting for item, with cancel the download
+        # stops too unless somebody else still waits for it
+        with self.lock:
+            item.users -= 1
+            if item.users > 0:
+                return
+            if self.items.get(item.filepath) is item:
+                del self.items[item.filepath]
+            if cancel and not item.finished:
+                item.cancelled.set()
+                # at once: the progress callback never runs while the
+                # worker waits for somebody else's download of the file
+                item.state = 'CANCELLED'
+
+    def pending(self):
+        with self.lock:
+            return [item for item in self.items.values() if not item.finished]
+
+    def shutdown(self):
+        with self.lock:
+            for item in self.items.values():
+                item.cancelled.set()
+                if not item.finished:
+                    item.state = 'CANCELLED'
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+                self.executor = None
+
+
+downloads = DownloadQueue()
+
+########################################################################
+########################################################################
+
+
+SEARCH_LIMIT = 100
+WORD_RE = re.compile(r'\w+')
+CACHED_LIST_RE = re.compile(r'^(?:[a-z]*-)?cat-(\d+)$')
+CACHED_DETAIL_RE = re.compile(r'^mat-(\d+)$')
+RANK_FIELDS = ('rating', 'downloads', 'votes')
+INTERNED_FIELDS = ('slug', 'name')
+
+class MaterialRecord(object):
+    # What the catalogue keeps of a material, whatever the list or detail
+    # it came from carried. Slugs and names are interned, so the copies
+    # from the lists of every engine and category share one string.
+    __slots__ = (
+        'id', 'slug', 'name', 'description', 'rating', 'downloads', 'votes',
+        'storage_name', 'image', 'storage',
+    )
+
+    def __init__(self, id):
+        self.id = id
+        self.slug = ''
+        self.name = ''
+        self.description = None
+        self.rating = None
+        self.downloads = None
+        self.votes = None
+        self.storage_name = None
+        self.image = None
+        self.storage = None
+
+    def update(self, mat):
+        # fields the data does not have are kept
+        for field in self.__slots__[1:]:
+            if field in mat:
+                value = mat[field]
+                if field in INTERNED_FIELDS and isinstance(value, str):
+                    value = sys.intern(value)
+                setattr(self, field, value)
+
+    def as_dict(self):
+        return dict((field, getattr(self, field)) for field in self.__slots__)
+
+class Catalogue(object):
+    # Everything known about materials from the cached lists and details,
+    # with an inverted word index to search them without the network.
+
+    def __init__(self):
+        self.lock = Lock()
+        self.materials = {} # material id -> MaterialRecord
+        self.categories = {} # category id -> material ids
+        self.postings = {} # word -> material ids
+        self.words = {} # material id -> words it is indexed under
+        self.sorted_words = None
+        self.sources = {} # cache file -> version of it that was indexed
+        self.scanned = None
+        self.member_of = {} # material id -> category ids
+        self.ranks = {} # (category id, field) -> sorted (-value, material id)
+        self.positions = {} # (category id, field) -> {material id: rank}
+
+    def add_materials(self, source, mats, category=None, version=None):
+        # version tells what source was read from, see CacheIndex.version()
+        with self.lock:
+            if version is not None and self.sources.get(source) == version:
+                return # nothing changed since the last time
+            self.sources[source] = version
+            for mat in mats:
+                record = self.materials.get(mat['id'])
+                if record is None:
+                    record = self.materials[mat['id']] = MaterialRecord(mat['id'])
+                old_values = [getattr(record, field) for field in RANK_FIELDS]
+                record.update(mat)
+                self.index(record)
+                self.update_ranks(record, old_values) # in all its categories, not just this one
+            if category is not None:
+                for id in self.categories.get(category, ()):
+                    self.member_of[id].discard(category)
+                self.categories[category] = [mat['id'] for mat in mats]
+                for id in self.categories[category]:
+                    self.member_of.setdefault(id, set()).add(category)
+                self.build_ranks(category)
+
+    def detail(self, source, id, version):
+        # the detail of a material, if it was indexed from that version of
+        # its cache file
+        with self.lock:
+            record = self.materials.get(id)
+            if version is None or record is None or self.sources.get(source) != version:
+                return None
+            return record.as_dict()
+
+    def add_detail(self, source, mat, version):
+        # indexes the detail of a material, returns it like detail() does
+        self.add_materials(source, [mat], version=version)
+        with self.lock:
+            return self.materials[mat['id']].as_dict()
+
+    def extend_category(self, category, mats):
+        # adds a further page of a category list, without going over
+        # the materials that are there already
+        with self.lock:
+            ids = self.categories.setdefault(category, [])
+            for mat in mats:
+                record = self.materials.get(mat['id'])
+                if record is None:
+                    record = self.materials[mat['id']] = MaterialRecord(mat['id'])
+                old_values = [getattr(record, field) for field in RANK_FIELDS]
+                record.update(mat)
+                self.index(record)
+                self.update_ranks(record, old_values)
+                if category in self.member_of.get(record.id, ()):
+                    continue # a rescan of the cache put it there already
+                ids.append(record.id)
+                self.member_of.setdefault(record.id, set()).add(category)
+                for field in RANK_FIELDS:
+                    value = getattr(record, field)
+                    if value is not None:
+                        bisect.insort(self.ranks.setdefault((category, field), []), (-value, record.id))
+                        self.positions.pop((category, field), None)
+
+    def build_ranks(self, category):
+        records = [self.materials[id] for id in self.categories[category]]
+        for field in RANK_FIELDS:
+            self.ranks[(category, field)] = sorted(
+                (-getattr(r, field), r.id) for r in records if getattr(r, field) is not None
+            )
+            self.positions.pop((category, field), None)
+
+    def update_ranks(self, record, old_values):
+        # move a material inside the rankings of all its categories
+        for category in self.member_of.get(record.id, ()):
+            for field, old_value in zip(RANK_FIELDS, old_values):
+                new_value = getattr(record, field)
+                if new_value == old_value:
+                    continue
+                entries = self.ranks.setdefault((category, field), [])
+                if old_value is not None:
+                    i = bisect.bisect_left(entries, (-old_value, record.id))
+                    if i < len(entries) and entries[i] == (-old_value, record.id):
+                        del entries[i]
+                if new_value is not None:
+                    bisect.insort(entries, (-new_value, record.id))
+                self.positions.pop((category, field), None)
+
+    def rank_positions(self, category, field):
+        # {material id: place}, best first, or None for unknown categories
+        with self.lock:
+            key = (category, field)
+            if key not in self.ranks:
+                return None
+            if key not in self.positions:
+                self.positions[key] = {id: i for i, (_, id) in enumerate(self.ranks[key])}
+            return self.positions[key]
+
+    def index(self, record):
+        text = ' '.join((
+            record.name or '',
+            (record.slug or '').replace('-', ' '),
+            record.description or '',
+        ))
+        words = set(WORD_RE.findall(text.lower()))
+        old_words = self.words.get(record.id, set())
+        for word in old_words - words:
+            self.postings[word].discard(record.id)
+            if not self.postings[word]:
+                del self.postings[word]
+                self.sorted_words = None
+        for word in words - old_words:
+            if word not in self.postings:
+                self.postings[word] = set()
+                self.sorted_words = None
+            self.postings[word].add(record.id)
+        self.words[record.id] = words
+
+    def scan_cache(self, path):
+        # pick up everything cached by earlier sessions, once per directory
+        if self.scanned == path:
+            return
+        self.scanned = path
+        for name in os.listdir(path):
+            list_match = CACHED_LIST_RE.match(name)
+            detail_match = CACHED_DETAIL_RE.match(name)
+            if list_match is None and detail_match is None:
+                continue
+            filepath = os.path.join(path, name)
+            version = cache_index.version(filepath)
+            if version is not None and self.sources.get(filepath) == version:
+                continue
+            try:
+                data = load_data(filepath, keep=False)
+            except (OSError, ValueError, zlib.error):
+                continue
+            if list_match is not None:
+                self.add_materials(filepath, data, int(list_match.group(1)), version)
+            else:
+                self.add_materials(filepath, [data], version=version)
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        # every word of the query has to be a prefix of an indexed word
+        prefixes = WORD_RE.findall(query.lower())
+        if not prefixes:
+            return []
+        with self.lock:
+            if self.sorted_words is None:
+                self.sorted_words = sorted(self.postings)
+            found = None
+            for prefix in prefixes:
+                ids = set()
+                i = bisect.bisect_left(self.sorted_words, prefix)
+                while i < len(self.sorted_words) and self.sorted_words[i].startswith(prefix):
+                    ids |= self.postings[self.sorted_words[i]]
+                    i += 1
+                found = ids if found is None else found & ids
+                if not found:
+                    return []
+            records = [self.materials[id] for id in found]
+        # names starting with the query first, then alphabetically
+        return heapq.nsmallest(limit, records, key=lambda r: (
+            not r.name.lower().startswith(prefixes[0]),
+            r.name.lower(),
+        ))
+
+    # The material list only holds ids, its rows are drawn from here.
+
+    def name(self, id):
+        record = self.materials.get(id)
+        return record.name if record is not None else ''
+
+    def value(self, id, field):
+        record = self.materials.get(id)
+        return getattr(record, field) if record is not None else None
+
+
+catalogue = Catalogue()
 
 ########################################################################
 ########################################################################
@@ -417,6 +2140,7 @@ class Preview(object):
             self.set_preview_size(addon_prefs.preferences.use_big_preview)
 
         self.move = False
+        self.image_url = None # what it shows, the image_url property can't be read back
         self.glImage = None
         self.bindcode = None
 
@@ -427,8 +2151,19 @@ class Preview(object):
             self.width, self.height = 128, 128
 
     def load_image(self, image_url):
-        self.glImage = bpy.data.images.load(get_image(image_url))
-        self.glImage.gl_load(frame=bgl.GL_NEAREST) #, bgl.GL_NEAREST)
+        import bgl
+        self.image_url = image_url
+        # the full image only for the big preview
+        size = None if self.width > THUMBNAIL_SIZE else THUMBNAIL_SIZE
+        if _cache_only:
+            filepath = cached_image(image_url, size=size)
+            if filepath is None:
+                return
+        else:
+            filepath = get_image(image_url, size=size)
+        self.glImage = bpy.data.images.load(filepath)
+        with metrics.timer('texture_upload'):
+            self.glImage.gl_load(frame=bgl.GL_NEAREST) #, bgl.GL_NEAREST)
         #if bpy.app.version < (2, 77):
         self.bindcode = self.glImage.bindcode
         #else:
@@ -473,14 +2208,27 @@ class Preview(object):
             return {'PASS_THROUGH'}
 
 
+bmd_preview = None
+
+def get_preview():
+    # created on first use, reading preferences and GPU state isn't free
+    global bmd_preview
+    if bmd_preview is None:
+        bmd_preview = Preview()
+    return bmd_preview
+
 def image_changed(self, value):
-    bmd_preview.unload_image()
+    get_preview().unload_image()
     if value:
-        bmd_preview.load_image(value)
+        get_preview().load_image(value)
+    else:
+        get_preview().image_url = None
 
 
+@metrics.timed('draw_preview')
 def render_callback(self, context):
     if self.bindcode != None:
+        import bgl
 		
         bgl.glEnable(bgl.GL_BLEND)
         bgl.glEnable(bgl.GL_TEXTURE_2D)
@@ -504,51 +2252,328 @@ def render_callback(self, context):
 ########################################################################
 
 
+# While the browser is restored the update callbacks below only read the
+# cache, stale or not, so opening a file or switching scenes never waits
+# for the network. Update and the warm-up refresh it.
+_cache_only = False
+
+@contextmanager
+def cache_only():
+    global _cache_only
+    previous = _cache_only
+    _cache_only = True
+    try:
+        yield
+    finally:
+        _cache_only = previous
+
+@metrics.timed('update_categories', profile=True)
 def update_categories(context):
-    context.scene.bmd_category_list.clear()
+    context.window_manager.bmd_category_list.clear()
     addon_prefs = bpy.context.preferences.addons[__name__]
     if addon_prefs.preferences.api_key != '':
-        a = context.scene.bmd_category_list.add()
+        a = context.window_manager.bmd_category_list.add()
         a.id   = 0
         a.slug = 'favorites'
         a.name = '<Favorites>'
-    for i in get_categories():
-        a = context.scene.bmd_category_list.add()
+    if _cache_only:
+        categories = cached_json(os.path.join(get_cache_path(), 'categories')) or []
+    else:
+        categories = get_categories()
+    for i in categories:
+        a = context.window_manager.bmd_category_list.add()
         a.id   = i['id']
         a.slug = i['slug']
         a.name = i['name']
     update_materials(None, context)
 
 def update_materials(self, context):
-    context.scene.bmd_material_list.clear()
-    id = context.scene.bmd_category_list[context.scene.bmd_category_list_idx].id
-    if id == 0: # Favorites
-        mats = get_favorites()
+    with metrics.timer('update_materials', profile=True):
+        clear_material_list(context.window_manager)
+        if context.window_manager.bmd_category_list_idx >= len(context.window_manager.bmd_category_list):
+            return
+        id = context.window_manager.bmd_category_list[context.window_manager.bmd_category_list_idx].id
+        context.scene.bmd_category_id = id
+        path = get_cache_path()
+        if load_state(path).get('category') != id:
+            save_state(path, category=id)
+        if id == 0: # Favorites
+            ids = cached_favorites(get_engine(), path) if _cache_only else get_favorites()
+            source = lambda: ids
+            loading = lambda: False
+        else:
+            engine = get_engine()
+            if _cache_only:
+                ids = cached_materials(id, engine, path)
+            else:
+                ids = get_materials(id, engine, path)
+            source = lambda: ids # grows while pages come in
+            load = running_page_load(path, engine, id)
+            loading = load.loading if load is not None else lambda: False
+        add_material_rows(context.window_manager, ids[:FIRST_ROWS])
+        start_list_fill(id, source, loading)
+        if len(context.window_manager.bmd_material_list) > 0:
+            context.window_manager.bmd_material_list_idx = 0
+            update_active_material(self, context)
+
+# Big categories go into the material list in batches: the first rows
+# right away, the others from a timer, as they come out of the cache or
+# arrive from the server.
+FIRST_ROWS = 100
+ROWS_PER_TICK = 500
+
+# (category, material ids so far, more pages coming) the timer is filling the list with
+_list_fill = None
+
+# why the list shows only part of its category, for the panel
+_list_fill_error = None
+
+# Ids of the checked rows, kept up to date by the rows themselves so the
+# panel does not walk the whole list on every redraw to count them.
+_selected_ids = set()
+
+def selection_changed(self, context):
+    if self.selected:
+        _selected_ids.add(self.id)
     else:
-        mats = get_materials(id)
-    for i in mats:
-        a = context.scene.bmd_material_list.add()
-        a.id = i['id']
-        a.slug = i['slug']
-        a.name = i['name']
-    if len(context.scene.bmd_material_list) > 0:
-        context.scene.bmd_material_list_idx = 0
-        update_active_material(self, context)
+        _selected_ids.discard(self.id)
+
+def clear_material_list(wm):
+    wm.bmd_material_list.clear()
+    _selected_ids.clear()
+
+def add_material_rows(wm, ids):
+    for id in ids:
+        wm.bmd_material_list.add().id = id
+
+def start_list_fill(category, source, loading):
+    global _list_fill, _list_fill_error
+    _list_fill = (category, source, loading)
+    _list_fill_error = None
+    if not bpy.app.timers.is_registered(fill_material_list):
+        bpy.app.timers.register(fill_material_list, first_interval=0.0)
+
+def stop_list_fill():
+    global _list_fill, _list_fill_error
+    _list_fill = None
+    _list_fill_error = None
+    if bpy.app.timers.is_registered(fill_material_list):
+        bpy.app.timers.unregister(fill_material_list)
+
+def redraw_browser(wm):
+    for window in wm.windows:
+        for area in window.screen.areas:
+            if area.type == 'PROPERTIES':
+                area.tag_redraw()
+
+def fill_material_list(rows=ROWS_PER_TICK):
+    # timer, appends what has arrived until the list is complete
+    global _list_fill, _list_fill_error
+    if _list_fill is None:
+        return None
+    category, source, loading = _list_fill
+    wm = bpy.context.window_manager
+    idx = wm.bmd_category_list_idx
+    if idx >= len(wm.bmd_category_list) or wm.bmd_category_list[idx].id != category:
+        _list_fill = None # the list shows something else now
+        return None
+    try:
+        ids = source()
+    except (OSError, ValueError, zlib.error):
+        _list_fill = None
+        return None
+    start = len(wm.bmd_material_list)
+    if start < len(ids):
+        end = len(ids) if rows is None else start + rows
+        add_material_rows(wm, ids[start:end])
+        redraw_browser(wm)
+        return 0.0
+    try:
+        if loading():
+            return 0.2
+    except NETWORK_ERRORS as e:
+        _list_fill_error = 'Cannot load the rest of the category: %s' % (e,)
+        redraw_browser(wm)
+    _list_fill = None
+    return None
+
+def finish_list_fill():
+    # adds everything that is already there at once
+    if _list_fill is not None:
+        fill_material_list(rows=None)
+
+def search_materials(self, context):
+    with metrics.timer('search_materials', profile=True):
+        if not context.window_manager.bmd_search:
+            if len(context.window_manager.bmd_category_list) > 0:
+                update_materials(self, context)
+            return
+        catalogue.scan_cache(get_cache_path())
+        stop_list_fill() # the search results take the list over
+        clear_material_list(context.window_manager)
+        add_material_rows(
+            context.window_manager,
+            [record.id for record in catalogue.search(context.window_manager.bmd_search)],
+        )
 
 def update_active_material(self, context):
-    mat = get_material_detail(
-        context.scene.bmd_material_list[context.scene.bmd_material_list_idx].id,
-    )
-    context.scene.bmd_material_active.id = mat['id']
-    context.scene.bmd_material_active.slug = mat['slug']
-    context.scene.bmd_material_active.name = mat['name']
-    context.scene.bmd_material_active.description = mat['description']
-    context.scene.bmd_material_active.downloads = mat['downloads']
-    context.scene.bmd_material_active.rating = mat['rating']
-    context.scene.bmd_material_active.votes = mat['votes']
-    context.scene.bmd_material_active.storage_name = mat['storage_name']
-    context.scene.bmd_material_active.image_url = mat['image']
-    context.scene.bmd_material_active.library_url = mat['storage']
+    with metrics.timer('update_active_material', profile=True):
+        if context.window_manager.bmd_material_list_idx >= len(context.window_manager.bmd_material_list):
+            return
+        id = context.window_manager.bmd_material_list[context.window_manager.bmd_material_list_idx].id
+        if _cache_only:
+            mat = cached_detail(id, get_cache_path())
+            if mat is None:
+                return
+        else:
+            mat = get_material_detail(id)
+        context.window_manager.bmd_material_active.id = mat['id']
+        context.window_manager.bmd_material_active.slug = mat['slug']
+        context.window_manager.bmd_material_active.name = mat['name']
+        context.window_manager.bmd_material_active.description = mat['description']
+        context.window_manager.bmd_material_active.downloads = mat['downloads']
+        context.window_manager.bmd_material_active.rating = mat['rating']
+        context.window_manager.bmd_material_active.votes = mat['votes']
+        context.window_manager.bmd_material_active.storage_name = mat['storage_name']
+        context.window_manager.bmd_material_active.image_url = mat['image']
+        context.window_manager.bmd_material_active.library_url = mat['storage']
+        context.scene.bmd_material_id = mat['id']
+
+def restore_browser(context):
+    with cache_only():
+        restore_browser_from_cache(context)
+
+def restore_browser_from_cache(context):
+    # Refill the session browser from the cache and select what the
+    # scene had selected when it was last used.
+    wm = context.window_manager
+    scene = context.scene
+    if wm is None or scene is None:
+        return
+    category, material = scene.bmd_category_id, scene.bmd_material_id
+    if category < 0:
+        category = load_state(get_cache_path()).get('category', -1)
+    if len(wm.bmd_category_list) == 0:
+        if not cache_index.exists(os.path.join(get_cache_path(), 'categories')):
+            return # never browsed, wait for Update
+        update_categories(context)
+    if not wm.bmd_search:
+        for i, item in enumerate(wm.bmd_category_list):
+            if item.id == category:
+                if i != wm.bmd_category_list_idx:
+                    wm.bmd_category_list_idx = i
+                else:
+                    update_materials(None, context) # the engine may differ
+                break
+        finish_list_fill() # the material may be further down
+    for i, item in enumerate(wm.bmd_material_list):
+        if item.id == material:
+            if i != wm.bmd_material_list_idx:
+                wm.bmd_material_list_idx = i
+            break
+
+def restore_current_browser():
+    try:
+        restore_browser(bpy.context)
+    except NETWORK_ERRORS:
+        pass
+    return None
+
+# Owner of the msgbus subscription that follows scene switches.
+_browser_owner = object()
+
+def follow_scene_switch():
+    bpy.msgbus.clear_by_owner(_browser_owner)
+    bpy.msgbus.subscribe_rna(
+        key=(bpy.types.Window, 'scene'),
+        owner=_browser_owner,
+        args=(),
+        notify=restore_current_browser,
+    )
+
+@bpy.app.handlers.persistent
+def restore_browser_on_load(*args):
+    follow_scene_switch() # subscriptions do not survive loading a file
+    bpy.app.timers.register(restore_current_browser, first_interval=0.0)
+
+########################################################################
+########################################################################
+
+
+# Small things to remember between sessions, like the last category.
+def load_state(path):
+    try:
+        return load_data(os.path.join(path, 'state'))
+    except (OSError, ValueError, zlib.error):
+        return {}
+
+def save_state(path, **changes):
+    import json
+    state = dict(load_state(path))
+    state.update(changes)
+    dump_data(json.dumps(state).encode('UTF-8'), os.path.join(path, 'state'))
+
+# How many materials of the last category get details and thumbnails
+# fetched by the warm-up.
+WARM_DETAILS = 24
+
+_warm_thread = None
+
+def warm_cache(path, engine, key, category):
+    # background thread: fetch what the panel shows first
+    with request_priority(PRIORITY_PREFETCH):
+        try:
+            get_categories(path)
+            if category == 0 and key:
+                ids = get_favorites(engine, path, key)
+            elif category:
+                ids = get_materials(category, engine, path)
+            else:
+                ids = []
+            for id in ids[:WARM_DETAILS]:
+                detail = get_material_detail(id, path)
+                get_image(detail['image'], path, THUMBNAIL_SIZE)
+        except NETWORK_ERRORS:
+            pass # best effort, the panel tries again when it is used
+        finally:
+            cache_index.flush()
+
+def start_warm_up():
+    # timer, runs on the main thread where preferences and scene are safe
+    global _warm_thread
+    try:
+        addon_prefs = bpy.context.preferences.addons[__name__].preferences
+    except KeyError:
+        return None
+    if not addon_prefs.warm_cache:
+        return None
+    if _warm_thread is not None and _warm_thread.is_alive():
+        return None
+    path = get_cache_path()
+    category = getattr(bpy.context.scene, 'bmd_category_id', -1)
+    if category < 0:
+        category = load_state(path).get('category')
+    snapshot_settings()
+    _warm_thread = Thread(
+        target=warm_cache,
+        args=(path, get_engine(), addon_prefs.api_key, category),
+        daemon=True,
+    )
+    _warm_thread.start()
+    bpy.app.timers.register(finish_warm_up, first_interval=0.5)
+    return None
+
+def finish_warm_up():
+    if _warm_thread.is_alive():
+        return 0.5
+    if len(bpy.context.window_manager.bmd_category_list) > 0:
+        return None # already browsing
+    return restore_current_browser()
+
+@bpy.app.handlers.persistent
+def warm_up_on_load(*args):
+    if not bpy.app.timers.is_registered(start_warm_up):
+        bpy.app.timers.register(start_warm_up, first_interval=0.1)
 
 ########################################################################
 ########################################################################
@@ -559,20 +2584,15 @@ class BMDCategoryPG(bpy.types.PropertyGroup):
     slug : StringProperty()
     name : StringProperty()
 
-bpy.utils.register_class(BMDCategoryPG)
-bpy.types.Scene.bmd_category_list = CollectionProperty(type=BMDCategoryPG)
-bpy.types.Scene.bmd_category_list_idx = IntProperty(update=update_materials)
-bpy.types.Scene.bmd_category_active = PointerProperty(type=BMDCategoryPG)
-
 
+# Rows of the material list only hold the id, the name and the rest come
+# from the catalogue when they are drawn.
 class BMDMaterialListPG(bpy.types.PropertyGroup):
     id : IntProperty()
-    slug : StringProperty()
-    name : StringProperty()
-
-bpy.utils.register_class(BMDMaterialListPG)
-bpy.types.Scene.bmd_material_list = CollectionProperty(type=BMDMaterialListPG)
-bpy.types.Scene.bmd_material_list_idx = IntProperty(update=update_active_material)
+    selected : BoolProperty(
+        description="Import this material with Import Selected",
+        update=selection_changed,
+    )
 
 
 class BMDMaterialDetailPG(bpy.types.PropertyGroup):
@@ -588,24 +2608,152 @@ class BMDMaterialDetailPG(bpy.types.PropertyGroup):
     image_url : StringProperty(set=image_changed)
     library_url : StringProperty()
 
-bpy.utils.register_class(BMDMaterialDetailPG)
-bpy.types.Scene.bmd_material_active = PointerProperty(type=BMDMaterialDetailPG)
-bpy.types.Scene.bmd_preview = IntProperty()
+
+# The browser lives on the window manager, which is not saved, so the
+# lists are shared by all scenes and rebuilt from the cache. Scenes only
+# keep the ids of their selection.
+def register_properties():
+    bpy.types.WindowManager.bmd_category_list = CollectionProperty(type=BMDCategoryPG)
+    bpy.types.WindowManager.bmd_category_list_idx = IntProperty(update=update_materials)
+    bpy.types.WindowManager.bmd_category_active = PointerProperty(type=BMDCategoryPG)
+    bpy.types.WindowManager.bmd_material_list = CollectionProperty(type=BMDMaterialListPG)
+    bpy.types.WindowManager.bmd_material_list_idx = IntProperty(update=update_active_material)
+    bpy.types.WindowManager.bmd_search = StringProperty(
+        name="Search",
+        description="Search all cached materials by name, slug or description",
+        update=search_materials,
+        options={'TEXTEDIT_UPDATE'},
+    )
+    bpy.types.WindowManager.bmd_material_active = PointerProperty(type=BMDMaterialDetailPG)
+    bpy.types.WindowManager.bmd_preview = IntProperty()
+    bpy.types.Scene.bmd_category_id = IntProperty(default=-1)
+    bpy.types.Scene.bmd_material_id = IntProperty(default=-1)
+
+def unregister_properties():
+    del bpy.types.WindowManager.bmd_category_list
+    del bpy.types.WindowManager.bmd_category_list_idx
+    del bpy.types.WindowManager.bmd_category_active
+    del bpy.types.WindowManager.bmd_material_list
+    del bpy.types.WindowManager.bmd_material_list_idx
+    del bpy.types.WindowManager.bmd_search
+    del bpy.types.WindowManager.bmd_material_active
+    del bpy.types.WindowManager.bmd_preview
+    del bpy.types.Scene.bmd_category_id
+    del bpy.types.Scene.bmd_material_id
 
 ########################################################################
 ########################################################################
 
 
+# Imported materials carry the Blendermada id and a hash of the library
+# they came from as custom properties. The session index maps ids to the
+# datablock names, it is rebuilt from those properties after a file is
+# loaded or undo/redo replaced the data.
+imported_index = {}
+imported_index_valid = False
+
+@bpy.app.handlers.persistent
+def invalidate_imported_index(*args):
+    global imported_index_valid
+    imported_index_valid = False
+
+def find_imported(id, rescan=True):
+    global imported_index_valid
+    if not imported_index_valid:
+        imported_index.clear()
+        for mat in bpy.data.materials:
+            if 'bmd_id' in mat:
+                imported_index[mat['bmd_id']] = mat.name
+        imported_index_valid = True
+    key = imported_index.get(id)
+    if key is None:
+        return None
+    mat = bpy.data.materials.get(key)
+    if mat is None or (mat.library is None and mat.get('bmd_id') != id): # renamed or removed
+        # a renamed material is still here under another name
+        imported_index_valid = False
+        return find_imported(id, rescan=False) if rescan else None
+    return mat
+
 def material_imported(context):
-    name = context.scene.bmd_material_active.storage_name
-    if name in bpy.data.materials.keys():
-        return True
-    return False
+    return find_imported(context.window_manager.bmd_material_active.id) is not None
+
+_library_hashes = {}
+
+def library_hash(filepath):
+    mtime = os.path.getmtime(filepath)
+    if filepath not in _library_hashes or _library_hashes[filepath][0] != mtime:
+        import hashlib
+        digest = hashlib.sha1()
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        _library_hashes[filepath] = (mtime, digest.hexdigest())
+    return _library_hashes[filepath][1]
+
+def load_materials(filepath, names, link=False):
+    # One pass over the library for all the materials wanted from it.
+    # Goes through the data API only, so it needs no UI context and works
+    # in background mode too. Returns the datablocks in the order of
+    # names, None where a material could not be loaded.
+    try:
+        with bpy.data.libraries.load(filepath, link=link) as (data_from, data_to):
+            available = set(data_from.materials)
+            data_to.materials = [name for name in names if name in available]
+    except OSError: # not a blend file, download got damaged
+        return [None] * len(names)
+    loaded = iter(data_to.materials)
+    return [next(loaded) if name in available else None for name in names]
+
+def import_materials(filepath, details, link=False):
+    # returns {material id: datablock} for what could be imported
+    mats = load_materials(filepath, [detail['storage_name'] for detail in details], link=link)
+    digest = library_hash(filepath)
+    imported = {}
+    for detail, mat in zip(details, mats):
+        if mat is None:
+            continue
+        if mat.library is None:
+            mat['bmd_id'] = detail['id']
+            mat['bmd_library'] = digest
+            imported_index[detail['id']] = mat.name
+        else: # linked datablocks are read-only, remember them by library
+            imported_index[detail['id']] = (mat.name, mat.library.filepath)
+        imported[detail['id']] = mat
+    return imported
+
+def use_link(context):
+    return context.preferences.addons[__name__].preferences.import_link
+
+def assign_materials(objects, mats):
+    # a single material goes to the active slot, several get new slots
+    for ob in objects:
+        if ob is None or not hasattr(ob.data, 'materials'): # object isn't lamp or camera
+            continue
+        if len(mats) == 1 and len(ob.data.materials) > 0:
+            ob.material_slots[ob.active_material_index].material = mats[0]
+        else:
+            for mat in mats:
+                if mat.name not in ob.data.materials:
+                    ob.data.materials.append(mat)
 
 ########################################################################
 ########################################################################
 
 
+_session_started = False
+
+def start_session(context):
+    # Everything the browser needs beyond registration is set up the first
+    # time the panel is drawn, not when Blender starts.
+    global _session_started
+    if _session_started:
+        return
+    _session_started = True
+    configure_scheduler(None, context)
+    get_preview()
+
+
 class BMD_PT_Panel(bpy.types.Panel):
     """Creates a Panel in the Object properties window"""
     bl_label = "Blendermada Client"
@@ -615,6 +2763,12 @@ class BMD_PT_Panel(bpy.types.Panel):
     bl_context = "material"
 
     def draw(self, context):
+        # not decorated: Blender checks the argument count of draw()
+        with metrics.timer('draw_panel'):
+            self.draw_browser(context)
+
+    def draw_browser(self, context):
+        start_session(context)
         layout = self.layout
         layout.use_property_split = True
         row = layout.row(align=True)
@@ -624,29 +2778,114 @@ class BMD_PT_Panel(bpy.types.Panel):
         row.separator()
         row.operator('bmd.help', icon="HELP", text="")
         row.operator('bmd.support', icon="SOLO_ON", text="")
+        layout.prop(context.window_manager, 'bmd_search', text="", icon="VIEWZOOM")
         row = layout.row()
         col = row.column()
         col.label(text='Category')
-        col.template_list('BMD_UL_CategoryList', '', context.scene, 'bmd_category_list', context.scene, 'bmd_category_list_idx', rows=6)
+        col.template_list('BMD_UL_CategoryList', '', context.window_manager, 'bmd_category_list', context.window_manager, 'bmd_category_list_idx', rows=6)
         col = row.column()
         col.label(text='Material')
-        col.template_list('BMD_UL_MaterialList', '', context.scene, 'bmd_material_list', context.scene, 'bmd_material_list_idx', rows=6)
+        col.template_list('BMD_UL_MaterialList', '', context.window_manager, 'bmd_material_list', context.window_manager, 'bmd_material_list_idx', rows=6)
+        if _list_fill_error:
+            col.label(text=_list_fill_error, icon="ERROR")
+        if _selected_ids:
+            col.operator('bmd.import_selected', icon="IMPORT", text='Import Selected ({})'.format(len(_selected_ids)))
+        pending = downloads.pending()
+        if pending:
+            box = layout.box()
+            for item in pending:
+                box.label(
+                    text='{}: {:.0f}%'.format(item.name, item.progress * 100) if item.total else '{}: waiting'.format(item.name),
+                    icon="SORTTIME",
+                )
+            box.label(text='Press Esc to cancel')
         layout.label(text='Material Detail')
         box = layout.box()
         row = box.row()
         col = row.column()
-        col.label(text=context.scene.bmd_material_active.name)
+        col.label(text=context.window_manager.bmd_material_active.name)
         col = row.column()
-        col.label(text=': {}'.format(context.scene.bmd_material_active.downloads), icon="IMPORT")
-        col.label(text=': {:1.2f} ({} votes)'.format(context.scene.bmd_material_active.rating, context.scene.bmd_material_active.votes), icon="SOLO_ON")
-        for row in context.scene.bmd_material_active.description.split('\n'):
+        col.label(text=': {}'.format(context.window_manager.bmd_material_active.downloads), icon="IMPORT")
+        col.label(text=': {:1.2f} ({} votes)'.format(context.window_manager.bmd_material_active.rating, context.window_manager.bmd_material_active.votes), icon="SOLO_ON")
+        for row in context.window_manager.bmd_material_active.description.split('\n'):
             box.label(text=row)
-        #layout.template_image(context.scene, 'bmd_preview', {'NULL'})
+        #layout.template_image(context.window_manager, 'bmd_preview', {'NULL'})
 
 
 class BMD_UL_MaterialList(bpy.types.UIList):
+    sort_key: EnumProperty(
+        name="Sort by",
+        items=(
+            ('NONE', "Default", "Keep the order of the server"),
+            ('rating', "Rating", "Best rated first"),
+            ('downloads', "Downloads", "Most downloaded first"),
+            ('votes', "Votes", "Most voted first"),
+        ),
+    )
+    min_rating: FloatProperty(
+        name="Minimum rating",
+        description="Hide materials rated lower, or not rated yet",
+        min=0.0,
+        max=5.0,
+    )
+
     def draw_item(self, context, layout, data, item, icon, active_data, active_propname, index):
-        layout.label(text=item.name)
+        layout.prop(item, 'selected', text="")
+        layout.label(text=catalogue.name(item.id), icon="CHECKMARK" if find_imported(item.id) is not None else "NONE")
+        if self.sort_key != 'NONE':
+            value = catalogue.value(item.id, self.sort_key)
+            if value is not None:
+                layout.label(text='{:1.2f}'.format(value) if self.sort_key == 'rating' else str(value))
+
+    def draw_filter(self, context, layout):
+        row = layout.row(align=True)
+        row.prop(self, 'filter_name', text="")
+        row.prop(self, 'use_filter_invert', text="", icon="ARROW_LEFTRIGHT")
+        row = layout.row(align=True)
+        row.prop(self, 'sort_key', text="")
+        row.prop(self, 'use_filter_sort_reverse', text="", icon="SORT_ASC")
+        layout.prop(self, 'min_rating', slider=True)
+
+    def filter_items(self, context, data, propname):
+        items = getattr(data, propname)
+        flags = []
+        if self.filter_name:
+            # like UI_UL_list.filter_items_by_name, with the catalogue's names
+            pattern = self.filter_name.lower()
+            if not pattern.startswith('*'):
+                pattern = '*' + pattern
+            if not pattern.endswith('*'):
+                pattern += '*'
+            flags = [
+                self.bitflag_filter_item
+                if fnmatch.fnmatchcase(catalogue.name(item.id).lower(), pattern) != self.use_filter_invert else 0
+                for item in items
+            ]
+        if self.min_rating > 0.0:
+            if not flags:
+                flags = [self.bitflag_filter_item] * len(items)
+            for i, item in enumerate(items):
+                rating = catalogue.value(item.id, 'rating')
+                if rating is None or rating < self.min_rating:
+                    flags[i] &= ~self.bitflag_filter_item
+        order = []
+        if self.sort_key != 'NONE':
+            positions = None
+            if not context.window_manager.bmd_search and len(context.window_manager.bmd_category_list) > 0:
+                category = context.window_manager.bmd_category_list[context.window_manager.bmd_category_list_idx].id
+                positions = catalogue.rank_positions(category, self.sort_key)
+            if positions is None: # favorites or search results
+                positions = {}
+                for item in items:
+                    value = catalogue.value(item.id, self.sort_key)
+                    if value is not None:
+                        positions[item.id] = -value
+            unranked = float('inf') # materials without details go last
+            ranked = sorted(range(len(items)), key=lambda i: (positions.get(items[i].id, unranked), i))
+            order = [0] * len(items)
+            for new_index, old_index in enumerate(ranked):
+                order[old_index] = new_index
+        return flags, order
 
 
 class BMD_UL_CategoryList(bpy.types.UIList):
@@ -657,48 +2896,177 @@ class BMD_UL_CategoryList(bpy.types.UIList):
 class BMDImport(bpy.types.Operator):
     bl_idname = "bmd.import"
     bl_label = "Import"
+    bl_description = "Import the material, the library is downloaded in the background (Esc to cancel)"
+
+    def invoke(self, context, event):
+        with metrics.timer('op_import', profile=True):
+            active = context.window_manager.bmd_material_active
+            if find_imported(active.id) is not None:
+                return self.execute(context)
+            self.material = {'id': active.id, 'storage_name': active.storage_name}
+            self.object_name = context.active_object.name if context.active_object else ''
+            self.download = downloads.add(active.library_url, get_library_path(active.library_url))
+            self.timer = context.window_manager.event_timer_add(0.1, window=context.window)
+            context.window_manager.modal_handler_add(self)
+            return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        with metrics.timer('op_import_modal', profile=True):
+            if event.type == 'ESC':
+                self.finish(context, cancel=True)
+                self.report({'INFO'}, 'Import was cancelled.')
+                return {'CANCELLED'}
+            if event.type != 'TIMER':
+                return {'PASS_THROUGH'}
+            for area in context.screen.areas:
+                if area.type == 'PROPERTIES':
+                    area.tag_redraw()
+            if not self.download.finished:
+                return {'PASS_THROUGH'}
+            self.finish(context)
+            if self.download.state == 'FAILED':
+                self.report({'ERROR'}, 'Cannot download material library: %s' % (self.download.error,))
+                return {'CANCELLED'}
+            if self.download.state == 'CANCELLED':
+                return {'CANCELLED'}
+            return self.import_from(context, self.download.filepath, self.material, bpy.data.objects.get(self.object_name))
+
+    def finish(self, context, cancel=False):
+        context.window_manager.event_timer_remove(self.timer)
+        downloads.release(self.download, cancel)
+
     def execute(self, context):
-        if material_imported(context):
+        # blocking version, for scripts and background mode
+        with metrics.timer('op_import', profile=True):
+            active = context.window_manager.bmd_material_active
+            existing = find_imported(active.id)
+            if existing is not None:
+                assign_materials([bpy.context.active_object], [existing])
+                self.report({'INFO'}, 'Material \'%s\' is already here, it was reused.' % (existing.name,))
+                return {'FINISHED'}
+            try:
+                storage = get_library(active.library_url)
+            except NETWORK_ERRORS as e:
+                self.report({'ERROR'}, 'Cannot download material library: %s' % (e,))
+                return {'CANCELLED'}
+            return self.import_from(
+                context,
+                storage,
+                {'id': active.id, 'storage_name': active.storage_name},
+                bpy.context.active_object,
+            )
+
+    def import_from(self, context, storage, material, ob):
+        imported = import_materials(storage, [material], link=use_link(context))
+        if not imported: # some error while importing
             self.report(
                 {'WARNING'},
-                'Material with name \'%s\' already exists here. Please, rename it to import new one.' % (
-                    context.scene.bmd_material_active.storage_name,
-                )
+                'Material cannot be imported. Maybe library has been damaged. Please, report about it to Blendermada administrator.',
             )
             return {'CANCELLED'}
         else:
-            storage = get_library(context.scene.bmd_material_active.library_url)
-            directory = os.path.join(storage, 'Material', '')
-            filename = context.scene.bmd_material_active.storage_name
-            if bpy.app.version < (2, 72):
-                bpy.ops.wm.link_append(
-                    filepath=('%s%s' % (directory, filename)),
-                    directory=directory,
-                    filename=filename,
-                    relative_path=True,
-                    link=False,
-                )
-            else:
-                bpy.ops.wm.append(
-                    filepath=('%s%s' % (directory, filename)),
-                    directory=directory,
-                    filename=filename,
-                )
-            if not material_imported(context): # some error while importing
-                self.report(
-                    {'WARNING'},
-                    'Material cannot be imported. Maybe library has been damaged. Please, report about it to Blendermada administrator.',
-                )
+            assign_materials([ob], list(imported.values()))
+            self.report({'INFO'}, 'Material was imported succesfully.')
+            return {'FINISHED'}
+
+
+class BMDImportSelected(bpy.types.Operator):
+    bl_idname = "bmd.import_selected"
+    bl_label = "Import Selected"
+    bl_description = "Import all checked materials and assign them to the selected objects, the libraries are downloaded in the background (Esc to cancel)"
+
+    def invoke(self, context, event):
+        with metrics.timer('op_import_selected', profile=True):
+            if not self.prepare(context):
                 return {'CANCELLED'}
-            else:
-                ao = bpy.context.active_object
-                if hasattr(ao.data, 'materials'): # object isn't lamp or camera
-                    if len(ao.data.materials) == 0: # there is no material slot in object
-                        ao.data.materials.append(bpy.data.materials[context.scene.bmd_material_active.storage_name])
-                    else:
-                        ao.material_slots[ao.active_material_index].material = bpy.data.materials[context.scene.bmd_material_active.storage_name]
-                self.report({'INFO'}, 'Material was imported succesfully.')
-                return {'FINISHED'}
+            self.object_names = [ob.name for ob in context.selected_objects]
+            urls = set(mat['storage'] for mat in self.details)
+            self.downloads = [downloads.add(url, get_library_path(url)) for url in urls]
+            self.timer = context.window_manager.event_timer_add(0.1, window=context.window)
+            context.window_manager.modal_handler_add(self)
+            return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        with metrics.timer('op_import_selected_modal', profile=True):
+            if event.type == 'ESC':
+                self.finish(context, cancel=True)
+                self.report({'INFO'}, 'Import was cancelled.')
+                return {'CANCELLED'}
+            if event.type != 'TIMER':
+                return {'PASS_THROUGH'}
+            for area in context.screen.areas:
+                if area.type == 'PROPERTIES':
+                    area.tag_redraw()
+            if not all(item.finished for item in self.downloads):
+                return {'PASS_THROUGH'}
+            self.finish(context)
+            for item in self.downloads:
+                if item.state == 'FAILED':
+                    self.report({'ERROR'}, 'Cannot download material library: %s' % (item.error,))
+                    return {'CANCELLED'}
+                if item.state == 'CANCELLED':
+                    return {'CANCELLED'}
+            objects = [bpy.data.objects[name] for name in self.object_names if name in bpy.data.objects]
+            return self.import_from(context, dict((item.url, item.filepath) for item in self.downloads), objects)
+
+    def finish(self, context, cancel=False):
+        context.window_manager.event_timer_remove(self.timer)
+        for item in self.downloads:
+            downloads.release(item, cancel)
+
+    def execute(self, context):
+        # blocking version, for scripts and background mode
+        with metrics.timer('op_import_selected', profile=True):
+            if not self.prepare(context):
+                return {'CANCELLED'}
+            try:
+                libraries = get_libraries(set(mat['storage'] for mat in self.details))
+            except NETWORK_ERRORS as e:
+                self.report({'ERROR'}, 'Cannot download material library: %s' % (e,))
+                return {'CANCELLED'}
+            return self.import_from(context, libraries, context.selected_objects)
+
+    def prepare(self, context):
+        # finds the checked materials already here and the details of the others
+        ids = [item.id for item in context.window_manager.bmd_material_list if item.selected]
+        if not ids:
+            self.report({'WARNING'}, 'Check the materials to import first.')
+            return False
+        found = dict((id, find_imported(id)) for id in ids)
+        self.reused = [id for id in ids if found[id] is not None]
+        try:
+            self.details = [get_material_detail(id) for id in ids if found[id] is None]
+        except NETWORK_ERRORS as e:
+            self.report({'ERROR'}, 'Cannot connect to Blendermada: %s' % (e,))
+            return False
+        return True
+
+    def import_from(self, context, libraries, objects):
+        groups = {}
+        for mat in self.details:
+            groups.setdefault(libraries[mat['storage']], []).append(mat)
+        imported = []
+        for filepath, group in groups.items():
+            imported.extend(import_materials(filepath, group, link=use_link(context)).values())
+        # looked up again, Blender data may have changed while downloading
+        reused = [mat for mat in map(find_imported, self.reused) if mat is not None]
+        assign_materials(objects, reused + imported)
+        for item in context.window_manager.bmd_material_list:
+            if item.selected:
+                item.selected = False
+        if len(imported) < len(self.details):
+            self.report(
+                {'WARNING'},
+                '%d of %d materials imported. Maybe library has been damaged. Please, report about it to Blendermada administrator.' % (
+                    len(imported), len(self.details),
+                ),
+            )
+        else:
+            self.report(
+                {'INFO'},
+                '%d materials were imported succesfully, %d already here were reused.' % (len(imported), len(reused)),
+            )
+        return {'FINISHED'}
 
 
 class BMDUpdate(bpy.types.Operator):
@@ -706,8 +3074,13 @@ class BMDUpdate(bpy.types.Operator):
     bl_label = 'Update'
 
     def execute(self, context):
-        update_categories(context)
-        return {'FINISHED'}
+        with metrics.timer('op_update', profile=True):
+            try:
+                update_categories(context)
+            except NETWORK_ERRORS as e:
+                self.report({'ERROR'}, 'Cannot connect to Blendermada: %s' % (e,))
+                return {'CANCELLED'}
+            return {'FINISHED'}
 
 
 class BMDPreview(bpy.types.Operator):
@@ -716,14 +3089,14 @@ class BMDPreview(bpy.types.Operator):
     def __init__(self):
         super(BMDPreview, self).__init__()
     def modal(self, context, event):
-        return bmd_preview.event_callback(context, event)
+        return get_preview().event_callback(context, event)
     def invoke(self, context, event):
-        if not bmd_preview.activated:
-            bmd_preview.activate(context)
+        if not get_preview().activated:
+            get_preview().activate(context)
             context.window_manager.modal_handler_add(self)
             return {'RUNNING_MODAL'}
         else:
-            bmd_preview.deactivate(context)
+            get_preview().deactivate(context)
             return {'FINISHED'}
 
 
@@ -747,9 +3120,87 @@ class BMDSupport(bpy.types.Operator):
         return {'FINISHED'}
 
 
+def get_statistics():
+    stats = metrics.snapshot()
+    stats['scheduler'] = scheduler.stats()
+    stats['endpoints'] = get_endpoint_stats()
+    return stats
+
+
+class BMDExportStats(bpy.types.Operator):
+    bl_idname = 'bmd.export_stats'
+    bl_label = "Export Statistics"
+    bl_description = "Save timings, cache hits and traffic of this session as JSON"
+
+    filepath: StringProperty(subtype='FILE_PATH')
+    filter_glob: StringProperty(default='*.json', options={'HIDDEN'})
+
+    def invoke(self, context, event):
+        if not self.filepath:
+            self.filepath = 'blendermada-stats.json'
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+    def execute(self, context):
+        import json
+        try:
+            with open(bpy.path.abspath(self.filepath), 'w') as f:
+                json.dump(get_statistics(), f, indent=2)
+        except OSError as e:
+            self.report({'ERROR'}, 'Cannot write statistics: %s' % (e,))
+            return {'CANCELLED'}
+        self.report({'INFO'}, 'Statistics saved to %s' % (self.filepath,))
+        return {'FINISHED'}
+
+
+class BMDProfile(bpy.types.Operator):
+    bl_idname = 'bmd.profile'
+    bl_label = "Profile"
+    bl_description = "Start or stop recording a cProfile dump and a Chrome trace into the cache directory"
+
+    def execute(self, context):
+        if not profiler.active:
+            profiler.start()
+            self.report({'INFO'}, 'Profiling started, run the slow action and stop profiling.')
+            return {'FINISHED'}
+        try:
+            files = profiler.stop(os.path.join(get_cache_path(), 'profiles'))
+        except OSError as e:
+            self.report({'ERROR'}, 'Cannot write the profile: %s' % (e,))
+            return {'CANCELLED'}
+        self.report({'INFO'}, 'Profile saved to %s' % (', '.join(files),))
+        return {'FINISHED'}
+
+
+class BMDResetStats(bpy.types.Operator):
+    bl_idname = 'bmd.reset_stats'
+    bl_label = "Reset Statistics"
+    bl_description = "Start counting timings, cache hits and traffic from zero"
+
+    def execute(self, context):
+        metrics.reset()
+        scheduler.reset_stats()
+        return {'FINISHED'}
+
+
 def preview_size_update(self, context):
     addon_prefs = context.preferences.addons[__name__].preferences
-    bmd_preview.set_preview_size(addon_prefs.use_big_preview)
+    preview = get_preview()
+    preview.set_preview_size(addon_prefs.use_big_preview)
+    if preview.image_url:
+        preview.unload_image() # the other size uses another image tier
+        try:
+            preview.load_image(preview.image_url)
+        except NETWORK_ERRORS:
+            pass
+
+
+def configure_scheduler(self, context):
+    try:
+        addon_prefs = context.preferences.addons[__name__].preferences
+    except KeyError:
+        return
+    scheduler.configure(addon_prefs.max_connections, addon_prefs.requests_per_second)
 
 
 class BMDAddonPreferences(bpy.types.AddonPreferences):
@@ -759,6 +3210,7 @@ class BMDAddonPreferences(bpy.types.AddonPreferences):
         subtype='DIR_PATH',
         description="Change this path if you have some problems with cache saving",
         default=os.path.expanduser(os.path.join('~', '.blendermada')),
+        update=reset_cache_path,
     )
     use_big_preview: BoolProperty(
         name="Use a big preview",
@@ -769,15 +3221,104 @@ class BMDAddonPreferences(bpy.types.AddonPreferences):
         name="API key",
         description="Use it to access your favorites materials",
     )
+    warm_cache: BoolProperty(
+        name="Warm up cache",
+        description="Fetch categories and the last used category in the background when Blender starts or a file is opened",
+    )
+    show_stats: BoolProperty(
+        name="Statistics",
+        description="Show timings, cache hits and traffic of this session",
+    )
+    import_link: BoolProperty(
+        name="Link materials",
+        description="Link materials from the cached libraries instead of copying them into the file",
+    )
+    base_url: StringProperty(
+        name="Server",
+        description="Blendermada server or studio cache to download from",
+        default=DEFAULT_BASE_URL,
+        update=reset_opener,
+    )
+    mirrors: StringProperty(
+        name="Mirrors",
+        description="More servers with the same API, separated by commas. The fastest healthy one is used",
+        update=reset_opener,
+    )
+    media_mirrors: StringProperty(
+        name="Media servers",
+        description="Servers for thumbnails and libraries, separated by commas. Empty uses the API servers",
+        update=reset_opener,
+    )
+    ttl_categories: IntProperty(
+        name="Categories",
+        description="Minutes the category list is kept before it is fetched again",
+        default=DEFAULT_TTL['categories'] // 60,
+        min=0,
+        update=reset_ttl_policy,
+    )
+    ttl_materials: IntProperty(
+        name="Material lists",
+        description="Minutes a category's material list is kept before it is fetched again",
+        default=DEFAULT_TTL['materials'] // 60,
+        min=0,
+        update=reset_ttl_policy,
+    )
+    ttl_details: IntProperty(
+        name="Details",
+        description="Minutes material details (rating, downloads) are kept before they are fetched again",
+        default=DEFAULT_TTL['details'] // 60,
+        min=0,
+        update=reset_ttl_policy,
+    )
+    ttl_favorites: IntProperty(
+        name="Favorites",
+        description="Minutes the favorites list is kept before it is fetched again",
+        default=DEFAULT_TTL['favorites'] // 60,
+        min=0,
+        update=reset_ttl_policy,
+    )
+    ttl_images: IntProperty(
+        name="Thumbnails",
+        description="Minutes thumbnails are kept before they are fetched again",
+        default=DEFAULT_TTL['images'] // 60,
+        min=0,
+        update=reset_ttl_policy,
+    )
+    ttl_libraries: IntProperty(
+        name="Libraries",
+        description="Minutes material libraries are kept before they are fetched again",
+        default=DEFAULT_TTL['libraries'] // 60,
+        min=0,
+        update=reset_ttl_policy,
+    )
     proxy_use_proxy: BoolProperty(
         name="Use proxy",
         description="Use proxy for requests",
+        update=reset_opener,
     )
     proxy_server: StringProperty(
         name="Server",
+        update=reset_opener,
     )
     proxy_port: StringProperty(
         name="Port",
+        update=reset_opener,
+    )
+    max_connections: IntProperty(
+        name="Connections",
+        description="How many downloads may run at the same time",
+        default=MAX_CONNECTIONS,
+        min=1,
+        max=16,
+        update=configure_scheduler,
+    )
+    requests_per_second: FloatProperty(
+        name="Requests per second",
+        description="Upper limit of requests sent to one server",
+        default=REQUESTS_PER_SECOND,
+        min=0.1,
+        max=100.0,
+        update=configure_scheduler,
     )
     proxy_use_auth: BoolProperty(
         name="Use proxy authentication",
@@ -792,10 +3333,22 @@ class BMDAddonPreferences(bpy.types.AddonPreferences):
         layout = self.layout
         layout.prop(self, "use_big_preview")
         layout.prop(self, "cache_path")
+        layout.prop(self, "import_link")
+        layout.prop(self, "warm_cache")
         layout.separator()
         layout.label(text="Authentication")
         layout.prop(self, "api_key")
         layout.separator()
+        layout.label(text="Keep cached data (minutes, the server's Cache-Control wins)")
+        col = layout.column(align=True)
+        for name in DEFAULT_TTL:
+            col.prop(self, 'ttl_' + name)
+        layout.separator()
+        layout.label(text="Server")
+        layout.prop(self, "base_url")
+        layout.prop(self, "mirrors")
+        layout.prop(self, "media_mirrors")
+        layout.separator()
         layout.label(text="Proxy")
         row = layout.row()
         row.prop(self, "proxy_use_proxy")
@@ -807,33 +3360,138 @@ class BMDAddonPreferences(bpy.types.AddonPreferences):
             if self.proxy_use_auth:
                 row.prop(self, "proxy_user")
                 row.prop(self, "proxy_password")
+        layout.separator()
+        layout.label(text="Network")
+        row = layout.row()
+        row.prop(self, "max_connections")
+        row.prop(self, "requests_per_second")
+        stats = scheduler.stats()
+        for name in PRIORITY_NAMES:
+            queue = stats['queues'][name]
+            layout.label(text="{}: {} queued, {} served, wait {:.0f} ms avg / {:.0f} ms max".format(
+                name.capitalize(),
+                queue['queued'],
+                queue['served'],
+                queue['wait_avg'] * 1000,
+                queue['wait_max'] * 1000,
+            ))
+        for route, endpoints in get_endpoint_stats().items():
+            for endpoint in endpoints:
+                layout.label(text="{} {}: {}, {} requests, {} failed".format(
+                    route.upper(),
+                    endpoint['url'],
+                    'down' if endpoint['down'] else 'not measured' if endpoint['latency_ms'] is None
+                    else '{:.0f} ms'.format(endpoint['latency_ms']),
+                    endpoint['requests'],
+                    endpoint['failures'],
+                ))
+        layout.separator()
+        row = layout.row()
+        row.prop(self, "show_stats", icon='TRIA_DOWN' if self.show_stats else 'TRIA_RIGHT', emboss=False)
+        row.operator('bmd.reset_stats', text="", icon='LOOP_BACK')
+        row.operator('bmd.export_stats', text="", icon='EXPORT')
+        row.operator(
+            'bmd.profile',
+            text="Stop Profiling" if profiler.active else "Start Profiling",
+            icon='REC' if profiler.active else 'PLAY',
+            depress=profiler.active,
+        )
+        if self.show_stats:
+            self.draw_stats(layout.box())
+
+    def draw_stats(self, layout):
+        stats = metrics.snapshot()
+        counters = stats['bytes']
+        layout.label(text="Traffic: {:.1f} KiB received, {:.1f} KiB decoded ({} requests)".format(
+            counters.get('wire', 0) / 1024.0,
+            counters.get('decoded', 0) / 1024.0,
+            stats['timings'].get('http', {}).get('count', 0),
+        ))
+        layout.label(text="Cache: {:.1f} KiB read, {:.1f} KiB written".format(
+            counters.get('cache_read', 0) / 1024.0,
+            counters.get('cache_written', 0) / 1024.0,
+        ))
+        for resource, entry in stats['cache'].items():
+            layout.label(text="{}: {} hits, {} misses ({:.0%})".format(
+                resource.capitalize(), entry['hits'], entry['misses'], entry['hit_ratio'],
+            ))
+        layout.separator()
+        for name, entry in stats['timings'].items():
+            layout.label(text="{}: {} calls, {:.1f} ms avg, {} p95, {:.1f} ms max".format(
+                name,
+                entry['count'],
+                entry['avg_ms'],
+                '>{:g} ms'.format(LATENCY_BUCKETS[-1] * 1000) if entry['p95_ms'] is None else '{:g} ms'.format(entry['p95_ms']),
+                entry['max_ms'],
+            ))
 
 
 def register():
+    bpy.utils.register_class(BMDCategoryPG)
+    bpy.utils.register_class(BMDMaterialListPG)
+    bpy.utils.register_class(BMDMaterialDetailPG)
+    register_properties()
     bpy.utils.register_class(BMD_PT_Panel)
     bpy.utils.register_class(BMDImport)
+    bpy.utils.register_class(BMDImportSelected)
     bpy.utils.register_class(BMD_UL_MaterialList)
     bpy.utils.register_class(BMD_UL_CategoryList)
     bpy.utils.register_class(BMDUpdate)
     bpy.utils.register_class(BMDPreview)
     bpy.utils.register_class(BMDHelp)
     bpy.utils.register_class(BMDSupport)
+    bpy.utils.register_class(BMDExportStats)
+    bpy.utils.register_class(BMDResetStats)
+    bpy.utils.register_class(BMDProfile)
     bpy.utils.register_class(BMDAddonPreferences)
 
-    global bmd_preview
-    bmd_preview = Preview()
+    bpy.app.handlers.load_post.append(invalidate_imported_index)
+    bpy.app.handlers.undo_post.append(invalidate_imported_index)
+    bpy.app.handlers.redo_post.append(invalidate_imported_index)
+    bpy.app.handlers.load_post.append(warm_up_on_load)
+    bpy.app.handlers.load_post.append(restore_browser_on_load)
+    bpy.app.timers.register(start_warm_up, first_interval=1.0)
+    follow_scene_switch()
 
 
 def unregister():
+    downloads.shutdown()
+    cache_index.flush()
+    if profiler.active:
+        profiler.stop(os.path.join(get_cache_path(), 'profiles'))
+    if bmd_preview is not None and bmd_preview.activated:
+        bmd_preview.deactivate(bpy.context)
+    bpy.app.handlers.load_post.remove(invalidate_imported_index)
+    bpy.app.handlers.undo_post.remove(invalidate_imported_index)
+    bpy.app.handlers.redo_post.remove(invalidate_imported_index)
+    bpy.app.handlers.load_post.remove(warm_up_on_load)
+    bpy.app.handlers.load_post.remove(restore_browser_on_load)
+    bpy.msgbus.clear_by_owner(_browser_owner)
+    stop_list_fill()
+    for timer in (start_warm_up, finish_warm_up, restore_current_browser):
+        if bpy.app.timers.is_registered(timer):
+            bpy.app.timers.unregister(timer)
+
     bpy.utils.unregister_class(BMD_PT_Panel)
     bpy.utils.unregister_class(BMDImport)
+    bpy.utils.unregister_class(BMDImportSelected)
     bpy.utils.unregister_class(BMD_UL_MaterialList)
     bpy.utils.unregister_class(BMD_UL_CategoryList)
     bpy.utils.unregister_class(BMDUpdate)
     bpy.utils.unregister_class(BMDPreview)
     bpy.utils.unregister_class(BMDHelp)
     bpy.utils.unregister_class(BMDSupport)
+    bpy.utils.unregister_class(BMDExportStats)
+    bpy.utils.unregister_class(BMDResetStats)
+    bpy.utils.unregister_class(BMDProfile)
     bpy.utils.unregister_class(BMDAddonPreferences)
+    unregister_properties()
+    bpy.utils.unregister_class(BMDMaterialDetailPG)
+    bpy.utils.unregister_class(BMDMaterialListPG)
+    bpy.utils.unregister_class(BMDCategoryPG)
+
+    global _session_started
+    _session_started = False
 
 
 if __name__ == '__main__':
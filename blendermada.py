@@ -42,8 +42,8 @@ from bpy.props import *
 from urllib import request, parse
 import json
 import os
-import pickle
 import time
+import zlib
 from datetime import datetime
 
 
@@ -66,13 +66,31 @@ def get_cache_path():
         os.mkdir(path)
     return path
 
+# Cache files keep the raw JSON body as it came from the server, zlib
+# compressed when it is big enough to be worth it. Nothing is parsed until
+# somebody actually asks for the data, and parsed data is kept in memory
+# until the file changes.
+CACHE_COMPRESS_MIN_SIZE = 1024
+
+_loaded_data = {}
+
 def dump_data(data, filepath):
+    if len(data) >= CACHE_COMPRESS_MIN_SIZE:
+        data = zlib.compress(data, 1)
     with open(filepath, 'wb+') as f:
-        pickle.dump(data, f)
+        f.write(data)
+    _loaded_data.pop(filepath, None)
 
 def load_data(filepath):
-    with open(filepath, 'rb+') as f:
-        data = pickle.load(f)
+    mtime = os.path.getmtime(filepath)
+    if filepath in _loaded_data and _loaded_data[filepath][0] == mtime:
+        return _loaded_data[filepath][1]
+    with open(filepath, 'rb') as f:
+        raw = f.read()
+    if raw[:1] == b'\x78': # zlib header, JSON never starts with 'x'
+        raw = zlib.decompress(raw)
+    data = json.loads(str(raw, 'UTF-8'))
+    _loaded_data[filepath] = (mtime, data)
     return data
 
 def file_expired(filepath, seconds_to_live):
@@ -115,48 +133,44 @@ def bmd_urlopen(url, **kwargs):
     request.install_opener(opener)
     return request.urlopen('%s?%s' % (full_url, params))
 
+def fetch_json(filepath, url, **kwargs):
+    if not file_expired(filepath, 300):
+        try:
+            return load_data(filepath)
+        except (ValueError, zlib.error): # damaged file or pickle from older versions
+            pass
+    r = bmd_urlopen(url, **kwargs)
+    dump_data(r.read(), filepath)
+    return load_data(filepath)
+
 def get_materials(category):
     engine = get_engine()
     filepath = os.path.join(get_cache_path(), '{}-cat-{}'.format(engine, category))
-    if file_expired(filepath, 300):
-        r = bmd_urlopen(
-            '/api/materials/materials.json',
-            engine=engine,
-            category=category,
-        )
-        ans = json.loads(str(r.read(), 'UTF-8'))
-        dump_data(ans, filepath)
-    return load_data(filepath)
+    return fetch_json(
+        filepath,
+        '/api/materials/materials.json',
+        engine=engine,
+        category=category,
+    )
 
 def get_favorites():
     engine = get_engine()
     filepath = os.path.join(get_cache_path(), '{}-cat-fav'.format(engine))
-    if file_expired(filepath, 300):
-        addon_prefs = bpy.context.user_preferences.addons[__name__]
-        r = bmd_urlopen(
-            '/api/materials/v1/favorites.json',
-            engine=engine,
-            key=addon_prefs.preferences.api_key,
-        )
-        ans = json.loads(str(r.read(), 'UTF-8'))
-        dump_data(ans, filepath)
-    return load_data(filepath)
+    addon_prefs = bpy.context.user_preferences.addons[__name__]
+    return fetch_json(
+        filepath,
+        '/api/materials/v1/favorites.json',
+        engine=engine,
+        key=addon_prefs.preferences.api_key,
+    )
 
 def get_categories():
     filepath = os.path.join(get_cache_path(), 'categories')
-    if file_expired(filepath, 300):
-        r = bmd_urlopen('/api/materials/categories.json')
-        ans = json.loads(str(r.read(), 'UTF-8'))
-        dump_data(ans, filepath)
-    return load_data(filepath)
+    return fetch_json(filepath, '/api/materials/categories.json')
 
 def get_material_detail(id):
     filepath = os.path.join(get_cache_path(), 'mat-%s' % (id,))
-    if file_expired(filepath, 300):
-        r = bmd_urlopen('/api/materials/material.json', id=id)
-        ans = json.loads(str(r.read(), 'UTF-8'))
-        dump_data(ans, filepath)
-    return load_data(filepath)
+    return fetch_json(filepath, '/api/materials/material.json', id=id)
 
 def get_image(url):
     filepath = os.path.join(get_cache_path(), 'images')
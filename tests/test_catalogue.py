@@ -0,0 +1,63 @@
+# Tests of the material catalogue, run inside Blender:
+#
+#     blender --background --factory-startup --python tests/test_catalogue.py
+#
+# Feeds the catalogue lists and details the way the fetchers do and
+# checks that the rankings of every category stay consistent.
+
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from bench_startup import MODULE_NAME, load_addon
+
+
+def material(id, rating):
+    return {'id': id, 'slug': 'material-%d' % (id,), 'name': 'Material %d' % (id,), 'rating': rating}
+
+
+class CatalogueTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.addon = load_addon()
+
+    @classmethod
+    def tearDownClass(cls):
+        del sys.modules[MODULE_NAME]
+
+    def setUp(self):
+        self.catalogue = self.addon.Catalogue()
+
+    def assertRanking(self, category, ids):
+        entries = self.catalogue.ranks[(category, 'rating')]
+        self.assertEqual(entries, sorted(entries))
+        self.assertEqual(sorted(id for _, id in entries), sorted(ids))
+
+    def test_list_refresh_updates_other_categories(self):
+        mats = [material(id, float(id)) for id in range(1, 10)]
+        self.catalogue.add_materials('cat-10', mats, 10)
+        self.catalogue.add_materials('cat-20', mats, 20)
+        self.catalogue.add_materials('cat-10', [material(1, 7.5)], 10)
+        self.catalogue.add_materials('mat-1', [material(1, 2.5)])
+        self.assertRanking(20, range(1, 10))
+        self.assertIn((-2.5, 1), self.catalogue.ranks[(20, 'rating')])
+
+    def test_pages_after_a_rescan_are_not_added_twice(self):
+        self.catalogue.add_materials('cat-5', [material(1, 4.0)], 5)
+        self.catalogue.extend_category(5, [material(1, 4.0), material(2, 3.0)])
+        self.assertEqual(self.catalogue.categories[5], [1, 2])
+        self.assertRanking(5, [1, 2])
+
+
+def main():
+    argv = [sys.argv[0]] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    result = unittest.main(argv=argv, exit=False).result
+    sys.exit(0 if result.wasSuccessful() else 1)
+
+
+if __name__ == '__main__':
+    main()
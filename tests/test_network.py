@@ -0,0 +1,330 @@
+# Fault injection tests for the network layer, run inside Blender:
+#
+#     blender --background --factory-startup --python tests/test_network.py
+#
+# Drives the add-on's fetchers against benchmarks/mock_server.py with
+# injected 503s and truncated bodies, and against a server that accepts
+# connections but never answers, to check the timeouts, retries, the
+# circuit breaker and the fallback to stale cache entries.
+
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import bpy
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from bench_startup import MODULE_NAME, enable_addon
+from mock_server import MockServer
+
+
+class HangingServer(object):
+    # accepts connections and never answers
+
+    def __init__(self):
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(16)
+        self.url = 'http://127.0.0.1:%d/' % self.sock.getsockname()[1]
+        self.connections = []
+        self.thread = threading.Thread(target=self.accept, daemon=True)
+
+    def accept(self):
+        while True:
+            try:
+                self.connections.append(self.sock.accept()[0])
+            except OSError:
+                return
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.sock.close()
+        for connection in self.connections:
+            connection.close()
+
+
+class NetworkTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.addon = enable_addon()
+        cls.server = MockServer(categories=2, materials=10).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        cls.addon.unregister()
+        del sys.modules[MODULE_NAME]
+
+    def setUp(self):
+        addon = self.addon
+        self.tmp = tempfile.mkdtemp()
+        self.use_server(self.server.url)
+        self.server.failure_rate = 0.0
+        self.server.truncate_rate = 0.0
+        self.server.fail_next = 0
+        self.server.reset_stats()
+        addon._loaded_data.clear()
+        addon.cache_index = addon.CacheIndex()
+        with addon.breakers_lock:
+            addon.breakers.clear()
+        addon.scheduler.configure(addon.MAX_CONNECTIONS, 1000.0)
+        self.patch(addon, 'RETRY_BASE_DELAY', 0.0)
+        self.patch(addon, 'CONNECT_TIMEOUT', 0.5)
+        self.patch(addon, 'READ_TIMEOUT', 0.5)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def patch(self, obj, name, value):
+        old = getattr(obj, name)
+        setattr(obj, name, value)
+        self.addCleanup(setattr, obj, name, old)
+
+    def use_server(self, url):
+        prefs = bpy.context.preferences.addons[MODULE_NAME].preferences
+        prefs.cache_path = self.tmp
+        prefs.base_url = url
+        self.addon.reset_opener()
+        self.addon.reset_cache_path()
+        self.addon.reset_ttl_policy()
+
+    def requests(self):
+        return sum(entry['requests'] for entry in self.server.stats().values())
+
+    def breaker(self):
+        return self.addon.get_breaker(self.server.url)
+
+    def expire(self, resource):
+        # make cached entries of resource stale
+        self.addon.get_ttl_policy()[resource] = 0
+
+    def test_retries_after_503(self):
+        self.server.fail_next = self.addon.RETRY_ATTEMPTS - 1
+        categories = self.addon.get_categories()
+        self.assertEqual(len(categories), 2)
+        self.assertEqual(self.requests(), self.addon.RETRY_ATTEMPTS)
+        self.assertFalse(self.breaker().is_open)
+
+    def test_gives_up_after_retries(self):
+        from urllib import error
+        self.server.failure_rate = 1.0
+        with self.assertRaises(error.HTTPError) as raised:
+            self.addon.get_categories()
+        self.assertEqual(raised.exception.code, 503)
+        self.assertEqual(self.requests(), self.addon.RETRY_ATTEMPTS)
+
+    def test_no_retry_on_404(self):
+        from urllib import error
+        with self.assertRaises(error.HTTPError):
+            self.addon.get_material_detail(999999)
+        self.assertEqual(self.requests(), 1)
+        self.assertEqual(self.breaker().failures, 0)
+
+    def test_truncated_body_leaves_no_file(self):
+        detail = self.addon.get_material_detail(1)
+        self.server.truncate_rate = 1.0
+        with self.assertRaises(ConnectionError):
+            self.addon.get_image(detail['image'])
+        images = os.path.join(self.addon.get_cache_path(), 'images')
+        self.assertEqual([name for name in os.listdir(images) if name != 'meta'], [])
+        self.server.truncate_rate = 0.0
+        filepath = self.addon.get_image(detail['image'])
+        with open(filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.server.image)
+
+    def test_hanging_server_times_out(self):
+        with HangingServer() as hanging:
+            self.use_server(hanging.url)
+            start = time.monotonic()
+            with self.assertRaises(OSError):
+                self.addon.get_categories()
+            elapsed = time.monotonic() - start
+        self.assertLess(elapsed, self.addon.RETRY_ATTEMPTS * (self.addon.CONNECT_TIMEOUT + self.addon.READ_TIMEOUT) + 2.0)
+        self.assertEqual(self.addon.get_breaker(hanging.url).failures, self.addon.RETRY_ATTEMPTS)
+
+    def test_breaker_opens_and_fails_fast(self):
+        self.server.failure_rate = 1.0
+        while not self.breaker().is_open:
+            with self.assertRaises(OSError):
+                self.addon.get_categories()
+        self.assertEqual(self.requests(), self.addon.BREAKER_THRESHOLD)
+        self.server.reset_stats()
+        with self.assertRaises(self.addon.CircuitOpenError):
+            self.addon.get_categories()
+        self.assertEqual(self.requests(), 0)
+
+    def test_breaker_half_open_probe(self):
+        self.server.failure_rate = 1.0
+        self.breaker().cooldown = 0.2
+        while not self.breaker().is_open:
+            with self.assertRaises(OSError):
+                self.addon.get_categories()
+        time.sleep(0.3)
+        self.server.failure_rate = 0.0
+        self.server.reset_stats()
+        self.assertEqual(len(self.addon.get_categories()), 2)
+        self.assertEqual(self.requests(), 1) # a single probe closes it again
+        self.assertFalse(self.breaker().is_open)
+
+    def test_failed_probe_opens_again(self):
+        self.server.failure_rate = 1.0
+        self.breaker().cooldown = 0.2
+        while not self.breaker().is_open:
+            with self.assertRaises(OSError):
+                self.addon.get_categories()
+        time.sleep(0.3)
+        self.server.reset_stats()
+        with self.assertRaises(OSError):
+            self.addon.get_categories()
+        self.assertEqual(self.requests(), 1)
+        self.assertTrue(self.breaker().is_open)
+
+    def test_server_lifetimes_survive_a_restart(self):
+        self.patch(self.server, 'cache_control', 'max-age=600')
+        for id in range(1, 6):
+            self.addon.get_material_detail(id)
+        self.addon.cache_index.flush()
+        self.addon._loaded_data.clear()
+        index = self.addon.CacheIndex()
+        filepath = os.path.join(self.addon.get_cache_path(), 'mat-5')
+        self.assertTrue(index.exists(filepath))
+        self.assertAlmostEqual(index.expiry[filepath], time.time() + 600, delta=5)
+
+    def test_cache_cleared_while_running(self):
+        detail = self.addon.get_material_detail(1)
+        image = self.addon.get_image(detail['image'])
+        self.addon.get_categories()
+        shutil.rmtree(self.addon.get_cache_path())
+        self.addon._loaded_data.clear()
+        self.server.reset_stats()
+        self.assertEqual(len(self.addon.get_categories()), 2)
+        self.assertEqual(self.addon.get_image(detail['image']), image)
+        self.assertTrue(os.path.isfile(image))
+        self.assertEqual(self.requests(), 2)
+
+    def test_stale_cache_when_offline(self):
+        categories = self.addon.get_categories()
+        self.expire('categories')
+        self.server.failure_rate = 1.0
+        self.addon._loaded_data.clear()
+        self.assertEqual(self.addon.get_categories(), categories)
+        self.assertEqual(self.requests(), 1 + self.addon.RETRY_ATTEMPTS)
+
+    def test_stale_materials_when_offline(self):
+        ids = self.addon.get_materials(1, 'cyc')
+        self.expire('materials')
+        with self.addon._engine_index_lock:
+            entry = self.addon._engine_index[self.addon.get_cache_path()]['cyc']['1']
+            entry['max_age'] = 0
+        self.server.failure_rate = 1.0
+        self.assertEqual(self.addon.get_materials(1, 'cyc'), ids)
+
+    def test_tier_falls_back_to_full_image(self):
+        detail = self.addon.get_material_detail(1)
+        filepath = self.addon.get_image(detail['image'])
+        self.addon._image_tiers.clear()
+        self.server.failure_rate = 1.0
+        found = []
+        # off the main thread, where the full image stands in for the tier
+        thread = threading.Thread(
+            target=lambda: found.append(self.addon.get_image(detail['image'], size=self.addon.THUMBNAIL_SIZE)),
+        )
+        thread.start()
+        thread.join()
+        self.assertEqual(found, [filepath])
+
+    def test_full_image_keeps_the_server_lifetime(self):
+        detail = self.addon.get_material_detail(1)
+        self.addon._image_tiers.clear()
+        found = []
+        def fetch(): # the mock's image is bigger, so it is kept as the full one
+            found.append(self.addon.get_image(detail['image'], size=self.server.image_size // 2))
+        thread = threading.Thread(target=fetch)
+        thread.start()
+        thread.join()
+        self.assertNotIn(found[0], self.addon.cache_index.expiry) # the policy applies
+        self.assertEqual(self.addon.cache_index.dirty, set())
+        os.remove(found[0])
+        self.addon.cache_index.forget(found[0])
+        self.patch(self.server, 'cache_control', 'max-age=600')
+        thread = threading.Thread(target=fetch)
+        thread.start()
+        thread.join()
+        self.assertAlmostEqual(self.addon.cache_index.expiry[found[1]], time.time() + 600, delta=5)
+
+    def test_cancel_leaves_shared_downloads_alone(self):
+        detail = self.addon.get_material_detail(1)
+        filepath = self.addon.get_library_path(detail['storage'])
+        downloads = self.addon.downloads
+        # somebody else is fetching the file, the queue waits for them
+        release = threading.Event()
+        other = threading.Thread(target=self.addon.flight.do, args=(filepath, release.wait))
+        other.start()
+        self.addCleanup(other.join)
+        self.addCleanup(release.set)
+        first = downloads.add(detail['storage'], filepath)
+        second = downloads.add(detail['storage'], filepath)
+        self.assertIs(first, second)
+        downloads.release(first, cancel=True)
+        self.assertFalse(second.finished)
+        downloads.release(second, cancel=True)
+        self.assertEqual(second.state, 'CANCELLED')
+        self.assertEqual(downloads.pending(), [])
+
+    def test_indexed_data_is_not_kept(self):
+        ids = self.addon.get_materials(1, 'cyc')
+        self.server.catalogue.materials[ids[0]]['license'] = 'CC0' # a field the add-on does not know
+        self.addCleanup(self.server.catalogue.materials[ids[0]].pop, 'license')
+        detail = self.addon.get_material_detail(ids[0])
+        names = [os.path.basename(filepath) for filepath in self.addon._loaded_data]
+        self.assertEqual([name for name in names if name.startswith(('cat-', 'mat-'))], [])
+        self.server.reset_stats()
+        self.assertEqual(self.addon.get_material_detail(ids[0]), detail)
+        self.assertEqual(self.addon.get_materials(1, 'cyc'), ids)
+        self.assertEqual(self.requests(), 0)
+
+    def test_local_write_error_spares_the_server(self):
+        detail = self.addon.get_material_detail(1)
+        images = os.path.join(self.addon.get_cache_path(), 'images')
+        shutil.rmtree(images)
+        with open(images, 'wb'): # a file where the folder should be
+            pass
+        self.server.reset_stats()
+        for _ in range(3):
+            with self.assertRaises(OSError):
+                self.addon.get_image(detail['image'])
+        self.assertEqual(self.requests(), 3) # no retries
+        self.assertEqual(self.breaker().failures, 0)
+        self.assertEqual(len(self.addon.get_categories()), 2)
+
+    def test_local_write_error_is_kept(self):
+        detail = self.addon.get_material_detail(1)
+        images = os.path.join(self.addon.get_cache_path(), 'images')
+        shutil.rmtree(images)
+        with open(images, 'wb'):
+            pass
+        with self.assertRaises(NotADirectoryError) as raised:
+            self.addon.get_image(detail['image'])
+        # the error that stopped the download, not one from cleaning up after it
+        self.assertIsNone(raised.exception.__context__)
+
+
+def main():
+    argv = [sys.argv[0]] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    result = unittest.main(argv=argv, exit=False).result
+    sys.exit(0 if result.wasSuccessful() else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+# Caching Blendermada server for a studio LAN, runs in Blender without UI:
+#
+#     blender --background --factory-startup --python tools/lan_server.py -- [--port 8080] [--cache DIR] [--upstream URL]
+#
+# Serves the same API and media paths as the site, using the add-on's
+# own cache and fetch code, so every category list, thumbnail and
+# library is downloaded once per site instead of once per seat. Point
+# the add-on's Server preference on the workstations at
+# http://<this machine>:<port>/.
+#
+# Favorites are personal and are passed through without caching. Material
+# lists are served in pages when the add-on asks for them.
+
+import argparse
+import gzip
+import os
+import sys
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import bpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from bench_startup import MODULE_NAME, enable_addon
+from mock_server import paginate
+
+
+def read_cached(filepath):
+    # the raw JSON body, cache files may be zlib compressed
+    with open(filepath, 'rb') as f:
+        raw = f.read()
+    if raw[:1] == b'\x78':
+        raw = zlib.decompress(raw)
+    return raw
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_GET(self):
+        addon = self.server.addon
+        url = urlsplit(self.path)
+        query = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+        try:
+            body, content_type = self.route(addon, url.path, query)
+        except addon.NETWORK_ERRORS as e:
+            code = getattr(e, 'code', None) or 502
+            return self.send_body(code, str(e).encode('UTF-8'), 'text/plain')
+        except (KeyError, ValueError):
+            return self.send_body(404, b'not found', 'text/plain')
+        self.send_body(200, body, content_type)
+
+    def route(self, addon, path, query):
+        import json
+        cache = self.server.cache_path
+        if path == '/api/materials/categories.json':
+            addon.get_categories(cache)
+            return read_cached(os.path.join(cache, 'categories')), 'application/json'
+        if path == '/api/materials/materials.json':
+            category = int(query['category'])
+            ids = addon.get_materials(category, query['engine'], cache, wait=True)
+            shared = json.loads(read_cached(os.path.join(cache, 'cat-%s' % (category,))))
+            by_id = dict((mat['id'], mat) for mat in shared)
+            mats = [by_id[id] for id in ids if id in by_id]
+            if 'page' in query:
+                mats = paginate(mats, path, query)
+            return json.dumps(mats).encode('UTF-8'), 'application/json'
+        if path == '/api/materials/material.json':
+            id = int(query['id'])
+            addon.get_material_detail(id, cache)
+            mat = json.loads(read_cached(os.path.join(cache, 'mat-%s' % (id,))))
+            for key in ('image', 'storage'): # media comes through here too
+                mat[key] = 'http://%s%s' % (self.headers['Host'], urlsplit(mat[key]).path)
+            return json.dumps(mat).encode('UTF-8'), 'application/json'
+        if path == '/api/materials/v1/favorites.json':
+            return addon.bmd_fetch(path, addon.read_response, **query), 'application/json'
+        if path.startswith('/media/'):
+            name = os.path.basename(path)
+            if not name or name.startswith('.'):
+                raise KeyError(path)
+            if name.endswith('.blend'):
+                filepath = os.path.join(cache, 'files', name)
+                content_type = 'application/octet-stream'
+            else:
+                filepath = os.path.join(cache, 'images', name)
+                content_type = 'image/png' if name.endswith('.png') else 'image/jpeg'
+            addon.fetch_file(filepath, path)
+            with open(filepath, 'rb') as f:
+                return f.read(), content_type
+        raise KeyError(path)
+
+    def send_body(self, status, body, content_type):
+        encoding = None
+        if content_type == 'application/json' and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body, encoding = gzip.compress(body, 6), 'gzip'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    parser = argparse.ArgumentParser(description='Serve Blendermada from a shared cache on the LAN.')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--cache', default=os.path.expanduser(os.path.join('~', '.blendermada-lan')))
+    parser.add_argument('--upstream', default=None, help='server to fetch from, blendermada.com by default')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    addon = enable_addon()
+    prefs = bpy.context.preferences.addons[MODULE_NAME].preferences
+    prefs.cache_path = args.cache
+    if args.upstream:
+        prefs.base_url = args.upstream
+    cache_path = addon.get_cache_path()
+    addon.snapshot_settings() # for the handler threads
+
+    httpd = ThreadingHTTPServer((args.host, args.port), Handler)
+    httpd.daemon_threads = True
+    httpd.addon = addon
+    httpd.cache_path = cache_path
+    httpd.verbose = args.verbose
+    print('Serving Blendermada from %s on port %d (Ctrl+C to stop)' % (cache_path, args.port))
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    httpd.server_close()
+    addon.unregister()
+
+
+if __name__ == '__main__':
+    main()